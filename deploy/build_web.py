@@ -0,0 +1,232 @@
+import argparse
+import gzip
+import hashlib
+import re
+import shutil
+import struct
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "web"
+OUT = ROOT / "build/web"
+
+# sizes browsers actually ask for from favicon.ico
+ICO_SIZES = (16, 32, 48)
+# PNG icons (apple-touch-icon, android); only built when Pillow is installed
+PNG_ICON_SIZES = (180, 192)
+# links for the transfer-time report, in bits per second
+LINKS = {"3g": 1_600_000, "4g": 10_000_000}
+# don't keep a compressed sibling that saves less than this
+MIN_SAVING = 0.1
+FINGERPRINT_LENGTH = 10
+
+
+def _protect_strings(text, pattern):
+    # swap string literals for placeholders so the minifier can't touch them
+    saved = []
+
+    def keep(match):
+        saved.append(match.group(0))
+        return f"\x00{len(saved) - 1}\x00"
+
+    return re.sub(pattern, keep, text), saved
+
+
+def _restore_strings(text, saved):
+    return re.sub("\x00(\\d+)\x00", lambda m: saved[int(m.group(1))], text)
+
+
+def minify_css(css):
+    css, saved = _protect_strings(css, r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    css = css.replace(";}", "}")
+    return _restore_strings(css, saved).strip()
+
+
+def minify_js(js):
+    # conservative: comments and indentation only, newlines stay so
+    # automatic semicolon insertion behaves exactly as in the source
+    js, saved = _protect_strings(js, r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`')
+    js = re.sub(r"/\*.*?\*/", "", js, flags=re.S)
+    js = re.sub(r"(^|[^:\\])//[^\n]*", r"\1", js)
+    lines = (line.strip() for line in js.splitlines())
+    return _restore_strings("\n".join(line for line in lines if line), saved)
+
+
+def minify_html(html):
+    # <pre>, <script> and <textarea> bodies are whitespace-sensitive
+    html, saved = _protect_strings(html, r"(?is)<(pre|script|textarea)\b.*?</\1>")
+    html = re.sub(r"<!--(?!\[if).*?-->", "", html, flags=re.S)
+    # any whitespace run renders as one space, dropping it entirely could
+    # glue inline elements together
+    html = re.sub(r"\s+", " ", html)
+    return _restore_strings(html, saved).strip()
+
+
+def ico_subset(data, sizes):
+    reserved, kind, count = struct.unpack("<HHH", data[:6])
+    entries = []
+    for i in range(count):
+        entry = data[6 + 16 * i : 22 + 16 * i]
+        width, height, colors, _, planes, bpp, size, offset = struct.unpack("<BBBBHHII", entry)
+        # a stored width of 0 means 256
+        if (width or 256) in sizes:
+            entries.append((entry[:12], data[offset : offset + size]))
+    if not entries:
+        return data
+    offset = 6 + 16 * len(entries)
+    header = struct.pack("<HHH", reserved, kind, len(entries))
+    directory, images = b"", b""
+    for prefix, image in entries:
+        directory += prefix + struct.pack("<II", len(image), offset)
+        images += image
+        offset += len(image)
+    return header + directory + images
+
+
+def png_icons(ico_path, sizes):
+    try:
+        from PIL import Image
+    except ImportError:
+        print("note: Pillow not installed, skipping PNG icon variants")
+        return {}
+    icons = {}
+    with Image.open(ico_path) as image:
+        image.size = max(image.info.get("sizes", [image.size]))
+        source = image.convert("RGBA")
+    for size in sizes:
+        resized = source.resize((size, size), Image.LANCZOS)
+        out = ROOT / "build" / f".icon-{size}.png"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        resized.save(out, optimize=True)
+        icons[f"icon-{size}.png"] = out.read_bytes()
+        out.unlink()
+    return icons
+
+
+def fingerprint(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{digest}.{ext}"
+
+
+def rewrite_refs(html, names):
+    def swap(match):
+        target = names.get(match.group(2).lstrip("/"))
+        return f'{match.group(1)}="/{target}"' if target else match.group(0)
+
+    return re.sub(r'\b(href|src)="([^"]+)"', swap, html)
+
+
+def compress(path):
+    data = path.read_bytes()
+    sizes = {"raw": len(data)}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data) * (1 - MIN_SAVING):
+        path.with_name(path.name + ".gz").write_bytes(gz)
+        sizes["gz"] = len(gz)
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data) * (1 - MIN_SAVING):
+            path.with_name(path.name + ".br").write_bytes(br)
+            sizes["br"] = len(br)
+    return sizes
+
+
+def _transfer_ms(size, bits_per_second):
+    return size * 8 / bits_per_second * 1000
+
+
+def report(rows):
+    header = f"{'file':<32}{'source':>9}{'built':>9}{'gzip':>9}{'brotli':>9}"
+    header += "".join(f"{name + ' ms':>10}" for name in LINKS)
+    print(header)
+    total_src = total_best = 0
+    for name, source_size, sizes in rows:
+        best = min(sizes.values())
+        total_src += source_size
+        total_best += best
+        line = f"{name:<32}{source_size:>9}{sizes['raw']:>9}"
+        line += f"{sizes.get('gz', '-'):>9}{sizes.get('br', '-'):>9}"
+        line += "".join(f"{_transfer_ms(best, bps):>10.0f}" for bps in LINKS.values())
+        print(line)
+    saving = 100.0 * (1 - total_best / total_src) if total_src else 0.0
+    print(f"{'total':<32}{total_src:>9}{total_best:>9}  ({saving:.0f}% smaller on the wire)")
+    for name, bps in LINKS.items():
+        print(
+            f"  {name}: {_transfer_ms(total_src, bps):.0f} ms -> {_transfer_ms(total_best, bps):.0f} ms"
+        )
+
+
+def build(src, out):
+    if out.exists():
+        shutil.rmtree(out)
+    out.mkdir(parents=True)
+
+    source_sizes = {}
+    assets = {}
+    css = (src / "styles.css").read_text(encoding="utf-8")
+    assets["styles.css"] = minify_css(css).encode()
+    source_sizes["styles.css"] = len(css.encode())
+    js = (src / "script.js").read_text(encoding="utf-8")
+    assets["script.js"] = minify_js(js).encode()
+    source_sizes["script.js"] = len(js.encode())
+    ico = (src / "favicon.ico").read_bytes()
+    assets["favicon.ico"] = ico_subset(ico, ICO_SIZES)
+    source_sizes["favicon.ico"] = len(ico)
+    for name, data in png_icons(src / "favicon.ico", PNG_ICON_SIZES).items():
+        assets[name] = data
+        source_sizes[name] = len(data)
+
+    names = {name: fingerprint(name, data) for name, data in assets.items()}
+    for name, data in assets.items():
+        (out / names[name]).write_bytes(data)
+    # browsers still request /favicon.ico on their own
+    (out / "favicon.ico").write_bytes(assets["favicon.ico"])
+
+    html = (src / "index.html").read_text(encoding="utf-8")
+    source_sizes["index.html"] = len(html.encode())
+    html = rewrite_refs(html, names)
+    icon_links = "".join(
+        f'<link rel="{"apple-touch-icon" if name == "icon-180.png" else "icon"}" '
+        f'sizes="{name[5:-4]}x{name[5:-4]}" href="/{names[name]}" />'
+        for name in names
+        if name.startswith("icon-")
+    )
+    html = html.replace("</head>", icon_links + "</head>")
+    (out / "index.html").write_text(minify_html(html), encoding="utf-8")
+
+    # linked from the SSH app and elsewhere, so it keeps its name
+    shutil.copyfile(src / "resume.pdf", out / "resume.pdf")
+    source_sizes["resume.pdf"] = (src / "resume.pdf").stat().st_size
+
+    rows = [
+        ("index.html", source_sizes["index.html"], compress(out / "index.html")),
+        ("resume.pdf", source_sizes["resume.pdf"], compress(out / "resume.pdf")),
+    ]
+    for name, built in names.items():
+        rows.append((built, source_sizes[name], compress(out / built)))
+    compress(out / "favicon.ico")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Minify, fingerprint and precompress web/ for nginx."
+    )
+    parser.add_argument("--src", type=Path, default=SRC)
+    parser.add_argument("--out", type=Path, default=OUT)
+    args = parser.parse_args()
+
+    rows = build(args.src, args.out)
+    report(rows)
+
+
+if __name__ == "__main__":
+    main()
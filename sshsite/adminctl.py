@@ -0,0 +1,34 @@
+import argparse
+import os
+import socket
+
+DEFAULT_SOCKET = os.environ.get("SSH_ADMIN_SOCKET", "/run/aidanek-sshsite/admin.sock")
+
+def admin_command(path, command, timeout=10.0):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(command.encode() + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode(errors="replace")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a command to the server admin socket.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("command", nargs="+", help="e.g. sessions, kill 3, set max_sessions 30")
+    args = parser.parse_args()
+
+    reply = admin_command(args.socket, " ".join(args.command))
+    print(reply, end="")
+    if reply.startswith("error:"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
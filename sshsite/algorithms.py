@@ -0,0 +1,90 @@
+import logging
+
+from asyncssh.encryption import get_encryption_algs
+from asyncssh.kex import get_kex_algs
+from asyncssh.mac import get_mac_algs
+
+# Named algorithm preference sets, compared by bench_handshake.py.
+# An empty list keeps asyncssh's own defaults for that category.
+ALGORITHM_SETS = {
+    # cheap key exchange, AEAD ciphers, encrypt-then-MAC for the CTR fallback
+    "fast": {
+        "kex": [
+            "curve25519-sha256",
+            "curve25519-sha256@libssh.org",
+            "mlkem768x25519-sha256",
+            "ecdh-sha2-nistp256",
+        ],
+        "encryption": [
+            # AES-GCM streams about twice as fast as chacha20 with AES-NI
+            "aes128-gcm@openssh.com",
+            "chacha20-poly1305@openssh.com",
+            "aes256-gcm@openssh.com",
+            "aes128-ctr",
+        ],
+        "mac": [
+            "hmac-sha2-256-etm@openssh.com",
+            "umac-128-etm@openssh.com",
+            "hmac-sha2-512-etm@openssh.com",
+        ],
+    },
+    # post-quantum hybrid only
+    "pq": {
+        "kex": ["mlkem768x25519-sha256"],
+        "encryption": ["chacha20-poly1305@openssh.com", "aes256-gcm@openssh.com"],
+        "mac": ["hmac-sha2-256-etm@openssh.com"],
+    },
+    "nistp256": {
+        "kex": ["ecdh-sha2-nistp256"],
+        "encryption": ["aes128-gcm@openssh.com"],
+        "mac": ["hmac-sha2-256-etm@openssh.com"],
+    },
+    "dh-group14": {
+        "kex": ["diffie-hellman-group14-sha256"],
+        "encryption": ["aes128-ctr"],
+        "mac": ["hmac-sha2-256"],
+    },
+    "asyncssh-default": {"kex": [], "encryption": [], "mac": []},
+}
+DEFAULT_SET = "fast"
+
+_AVAILABLE = {
+    "kex": get_kex_algs,
+    "encryption": get_encryption_algs,
+    "mac": get_mac_algs,
+}
+
+
+def _parse_list(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def resolve(set_name=DEFAULT_SET, kex=None, encryption=None, mac=None):
+    # comma-separated overrides replace one category of the named set
+    if set_name not in ALGORITHM_SETS:
+        raise ValueError(f"unknown algorithm set {set_name}: {', '.join(ALGORITHM_SETS)}")
+    chosen = dict(ALGORITHM_SETS[set_name])
+    for category, override in (("kex", kex), ("encryption", encryption), ("mac", mac)):
+        if override:
+            chosen[category] = _parse_list(override)
+
+    resolved = {}
+    for category, names in chosen.items():
+        available = {alg.decode() for alg in _AVAILABLE[category]()}
+        usable = [name for name in names if name in available]
+        missing = [name for name in names if name not in available]
+        if missing:
+            logging.warning("algorithms unavailable category=%s names=%s", category, ",".join(missing))
+        if names and not usable:
+            raise ValueError(f"no usable {category} algorithms in {','.join(names)}")
+        resolved[category] = usable
+    return resolved
+
+
+def connection_options(resolved):
+    # keyword arguments for asyncssh.create_server/connect
+    options = {}
+    for category, names in resolved.items():
+        if names:
+            options[f"{category}_algs"] = names
+    return options
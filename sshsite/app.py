@@ -1,54 +1,27 @@
+import asyncio
+import cProfile
+import os
+import signal
+import socket
+from collections import OrderedDict
+from pathlib import Path
 from random import choice, randint, random
 import time
+from functools import partial
 from typing import Iterable
 
 from rich.text import Text
+from textual import events
 from textual.app import App, ComposeResult, SystemCommand
 from textual.binding import Binding
+from textual.command import DiscoveryHit, Hit, Hits, Provider
 from textual.theme import Theme
 
 from textual.containers import Horizontal, Vertical
 from textual.widgets import Button, Static
 
-HOME = r"""Welcome to aidanek.dev
-
-Press ? for help
-
-       .__    .___                     __            .___           
-_____  |__| __| _/____    ____   ____ |  | __      __| _/_______  __
-\__  \ |  |/ __ |\__  \  /    \_/ __ \|  |/ /     / __ |/ __ \  \/ /
- / __ \|  / /_/ | / __ \|   |  \  ___/|    <     / /_/ \  ___/\   / 
-(____  /__\____ |(____  /___|  /\___  >__|_ \ /\ \____ |\___  >\_/  
-     \/        \/     \/     \/     \/     \/ \/      \/    \/     
-     
-     
-"""
-
-HELP = """Help / Controls
-
-h · home
-? · help
-r · resume
-^p · search
-q · quit
-"""
-
-RESUME = """Aidan Elliott-Korytek
-
-Security · Systems · Networking
-
-Skills
-
-Python, Java, C, Linux, Server Hardening, Binary Exploitation
-
-Projects
-
-- aidanek.dev interactive portfolio (asyncssh, Textual)
-
-- SSH config command line utility
-
-Full resume (PDF): https://aidanek.dev/resume.pdf
-"""
+import content
+import sampler
 
 SPLASH = r"""
 ====================================================================
@@ -79,6 +52,122 @@ THEME = Theme(
 
 ACCENT_COLOR = "#ff6a00"
 
+# animation tick intervals are multiplied by the profile's factor
+ANIMATION_PROFILES = {
+    "full": 1.0,
+    "lite": 3.0,
+}
+ANIMATION_SCALE = ANIMATION_PROFILES.get(os.environ.get("SSHSITE_ANIMATION", "full"), 1.0)
+
+# compiled content build picked by server.py; compiled in-process when unset
+CONTENT_DIR = os.environ.get("SSHSITE_CONTENT_DIR")
+
+
+def _load_content() -> dict[str, Text]:
+    profile = content.terminal_profile()
+    if CONTENT_DIR:
+        try:
+            return content.load(CONTENT_DIR, profile)
+        except OSError:
+            pass
+    return content.compile_profile(profile)
+
+
+CONTENT = _load_content()
+
+
+def _load_catalog() -> content.catalog.CatalogIndex:
+    if CONTENT_DIR:
+        try:
+            return content.load_catalog(CONTENT_DIR)
+        except OSError:
+            pass
+    return content.compile_catalog()
+
+
+# loaded prebuilt from the content build, so starting a session doesn't index
+CATALOG = _load_catalog()
+CATALOG_HITS = 20
+
+# seconds the rain splash stays up before the UI appears; server.py
+# shortens it for returning visitors and 0 skips it. Any key skips it too.
+SPLASH_SECONDS = float(os.environ.get("SSHSITE_SPLASH_SECONDS", "5.0"))
+
+# control channel from server.py (socketpair), one text command per line
+CONTROL_FD = os.environ.get("SSHSITE_CONTROL_FD")
+PROFILE_DIR = Path(
+    os.environ.get("SSHSITE_PROFILE_DIR", Path(__file__).resolve().parent / "logs/profiles")
+)
+
+# folded-stack sampler (sampler.py); started from server.py's env, toggled by
+# SIGUSR1 or "sampler on|off" on the control channel
+SAMPLER = sampler.Sampler(
+    os.environ.get("SSHSITE_SAMPLER_DIR", Path(__file__).resolve().parent / "logs/samples"),
+    "app",
+    float(os.environ.get("SSHSITE_SAMPLER_HZ", "100")),
+    float(os.environ.get("SSHSITE_SAMPLER_FLUSH", "60")),
+)
+
+class FrameGate:
+    # switched on by server.py while this session is over its egress budget:
+    # animation state keeps advancing, but only every KEEP-th tick of each
+    # widget is drawn, so frames are dropped here instead of queued upstream
+    KEEP = 4
+
+    def __init__(self) -> None:
+        self.active = False
+        self.dropped = 0
+        self._ticks: dict[int, int] = {}
+
+    def set_active(self, active: bool) -> None:
+        self.active = active
+        self._ticks.clear()
+
+    def allow(self, widget: Static) -> bool:
+        if not self.active:
+            return True
+        count = self._ticks.get(id(widget), 0) + 1
+        self._ticks[id(widget)] = count
+        if count % self.KEEP == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+FRAMES = FrameGate()
+
+class MemoStatic(Static):
+    # for widgets whose render is a pure function of a small state tuple:
+    # frames are built once per (class, state, size) and reused from a
+    # bounded LRU shared by every instance in this process. Cached Text is
+    # treated as immutable once stored. Subclasses implement build_render()
+    # and, unless they are static text, render_state().
+    RENDER_CACHE_SIZE = 256
+    _render_cache: OrderedDict = OrderedDict()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        # Textual's metaclass rules out ABCMeta, so check at class creation
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, "build_render", None)):
+            raise TypeError(f"{cls.__name__} must define build_render()")
+
+    def render_state(self) -> tuple:
+        return ()
+
+    def render(self) -> Text:
+        key = (type(self), self.render_state(), self.size.width, self.size.height)
+        cache = MemoStatic._render_cache
+        text = cache.get(key)
+        if text is not None:
+            cache.move_to_end(key)
+            return text
+        text = self.build_render()
+        cache[key] = text
+        if len(cache) > self.RENDER_CACHE_SIZE:
+            cache.popitem(last=False)
+        return text
+
+
 class RainSplash(Static):
     RAIN_COLORS = [
         "#ff6a00",
@@ -95,7 +184,7 @@ class RainSplash(Static):
         self._spawning = True
         self._ensure_drops()
         self._pulse()
-        self.set_interval(0.02, self._tick)
+        self.set_interval(0.02 * ANIMATION_SCALE, self._tick)
 
     def _pulse(self) -> None:
         if not self._pulsing:
@@ -111,12 +200,19 @@ class RainSplash(Static):
         self._pulsing = False
 
     def _ensure_drops(self) -> None:
-        width, height = max(1, self.size.width), max(1, self.size.height)
-        if (width, height) == self._last_size:
+        width, height = self.size.width, self.size.height
+        # nothing until the first layout, or every drop lands in column 0 and
+        # the resize rule below keeps them there
+        if not width or not height or (width, height) == self._last_size:
             return
         self._last_size = (width, height)
         count = max(12, width // 2)
-        self._drops = [self._new_drop(width, height) for _ in range(count)]
+        # keep drops whose column still exists so a resize doesn't restart the
+        # rain; drops below a shrunk bottom edge respawn in _tick as usual
+        drops = [drop for drop in self._drops if drop["x"] < width][:count]
+        if self._spawning:
+            drops.extend(self._new_drop(width, height) for _ in range(count - len(drops)))
+        self._drops = drops
 
     def _new_drop(self, width: int, height: int) -> dict:
         length = randint(4, 10)
@@ -139,7 +235,8 @@ class RainSplash(Static):
                 else:
                     drop["y"] = height + drop["length"] + 1
                     drop["speed"] = 0.0
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
     def stop_rain(self) -> None:
         self._spawning = False
 
@@ -227,7 +324,7 @@ class HomeWanderer(Static):
         self._dx = 1
         self._step = 0
         self._msg = choice(self._MESSAGES)
-        self.set_interval(0.09, self._tick)
+        self.set_interval(0.09 * ANIMATION_SCALE, self._tick)
 
     def _tick(self) -> None:
         width = max(1, self.size.width)
@@ -238,7 +335,8 @@ class HomeWanderer(Static):
             self._msg = choice(self._MESSAGES)
         self._x = (self._x + self._dx) % width
         self._step += 1
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
 
     def render(self) -> Text:
         width = max(10, self.size.width)
@@ -267,11 +365,12 @@ class HomeTicker(Static):
 
     def on_mount(self) -> None:
         self._offset = 0
-        self.set_interval(0.06, self._tick)
+        self.set_interval(0.06 * ANIMATION_SCALE, self._tick)
 
     def _tick(self) -> None:
         self._offset = (self._offset + 1) % len(self._TEXT)
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
 
     def render(self) -> Text:
         width = max(10, self.size.width)
@@ -285,11 +384,12 @@ class HomeTicker(Static):
 class HomeSparks(Static):
     def on_mount(self) -> None:
         self._tick_count = 0
-        self.set_interval(0.12, self._tick)
+        self.set_interval(0.12 * ANIMATION_SCALE, self._tick)
 
     def _tick(self) -> None:
         self._tick_count += 1
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
 
     def render(self) -> Text:
         width = max(10, self.size.width)
@@ -310,19 +410,19 @@ class HomeSparks(Static):
         text.stylize("#ffd7a6")
         return text
 
-class HomeFingerprint(Static):
+class HomeFingerprint(MemoStatic):
     _TEXT = (
         "ED25519 key fingerprint is SHA256:74WCiLMpyIPrysNUwu1WAc4DjhtyRxUDRTCV71oFvZw.\n"
         "This key is not known by any other names.\n"
         "Are you sure you want to continue connecting (yes/no/[fingerprint])?"
     )
 
-    def render(self) -> Text:
+    def build_render(self) -> Text:
         text = Text(self._TEXT)
         text.stylize("#3a3a3a")
         return text
 
-class HomeYesPrompt(Static):
+class HomeYesPrompt(MemoStatic):
     _PROMPT = "$ "
     _WORD = "yes"
 
@@ -331,7 +431,7 @@ class HomeYesPrompt(Static):
         self._pause = 0
         self._cursor_on = True
         self._entered = False
-        self.set_interval(0.12, self._tick)
+        self.set_interval(0.12 * ANIMATION_SCALE, self._tick)
         self.set_interval(0.4, self._blink)
 
     def _tick(self) -> None:
@@ -346,13 +446,17 @@ class HomeYesPrompt(Static):
                 self._index = 0
                 self._pause = 0
                 self._entered = False
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
 
     def _blink(self) -> None:
         self._cursor_on = not self._cursor_on
         self.refresh()
 
-    def render(self) -> Text:
+    def render_state(self) -> tuple:
+        return (self._index, self._cursor_on, self._entered)
+
+    def build_render(self) -> Text:
         typed = self._WORD[: self._index]
         cursor = "█" if self._cursor_on else " "
         if self._entered:
@@ -368,25 +472,29 @@ class HomeYesPrompt(Static):
             text.stylize(ACCENT_COLOR, len(self._PROMPT), len(self._PROMPT) + len(typed))
         return text
 
-class HomeTypewriter(Static):
+class HomeTypewriter(MemoStatic):
     _MESSAGE = "Welcome to aidanek.dev!"
 
     def on_mount(self) -> None:
         self._index = 0
         self._cursor_on = True
-        self.set_interval(0.08, self._tick)
+        self.set_interval(0.08 * ANIMATION_SCALE, self._tick)
         self.set_interval(0.4, self._blink)
 
     def _tick(self) -> None:
         if self._index < len(self._MESSAGE):
             self._index += 1
-        self.refresh()
+        if FRAMES.allow(self):
+            self.refresh()
 
     def _blink(self) -> None:
         self._cursor_on = not self._cursor_on
         self.refresh()
 
-    def render(self) -> Text:
+    def render_state(self) -> tuple:
+        return (self._index, self._cursor_on)
+
+    def build_render(self) -> Text:
         width = max(10, self.size.width)
         typed = self._MESSAGE[: self._index]
         cursor = "█" if self._cursor_on else " "
@@ -395,6 +503,26 @@ class HomeTypewriter(Static):
         text.stylize("#ffb347")
         return text
 
+class CatalogProvider(Provider):
+    async def search(self, query: str) -> Hits:
+        matcher = self.matcher(query)
+        for entry, score in CATALOG.search(query, CATALOG_HITS):
+            yield Hit(
+                score,
+                matcher.highlight(entry["title"]),
+                partial(self.app.show_catalog_entry, entry),
+                help=" · ".join(filter(None, (entry["kind"], entry.get("summary")))),
+            )
+
+    async def discover(self) -> Hits:
+        for entry in CATALOG.entries:
+            yield DiscoveryHit(
+                entry["title"],
+                partial(self.app.show_catalog_entry, entry),
+                help=entry["kind"],
+            )
+
+
 class SshSite(App):
     TITLE="aidanek.dev"
     SUB_TITLE="home"
@@ -551,6 +679,8 @@ class SshSite(App):
     }
     """
 
+    COMMANDS = App.COMMANDS | {CatalogProvider}
+
     BINDINGS = [
         Binding("h", "home", "Home"),
         Binding("question_mark", "help", "Help"),
@@ -560,7 +690,7 @@ class SshSite(App):
     ]
 
     def compose(self) -> ComposeResult:
-        self.body_text = Static(HOME, id="body_text")
+        self.body_text = Static(CONTENT["home"], id="body_text")
         self.home_view = Vertical(
             Static("press (?) for help", id="home_help"),
             HomeTypewriter(id="home_title"),
@@ -571,35 +701,11 @@ class SshSite(App):
             HomeSparks(id="home_sparks"),
             id="home_view",
         )
-        resume_link = "https://aidanek.dev/resume.pdf"
-        skills_title = "Skills"
-        skills_text = Text(
-            f"{skills_title}\n\nPython, Java, C, Linux, Server Hardening, Binary Exploitation"
-        )
-        skills_text.stylize(ACCENT_COLOR, 0, len(skills_title))
-        projects_title = "Projects"
-        projects_text = Text(
-            f"{projects_title}\n\n- aidanek.dev interactive portfolio (asyncssh, Textual)\n"
-            "\n- SSH config command line utility"
-        )
-        projects_text.stylize(ACCENT_COLOR, 0, len(projects_title))
-        name_text = Text("Aidan Elliott-Korytek\nSecurity · Systems · Networking")
-        name_text.stylize(ACCENT_COLOR, 0, len("Aidan Elliott-Korytek"))
-        resume_pdf_text = Text(f"Full resume (PDF): {resume_link}")
-        resume_pdf_title = "Full resume (PDF)"
-        resume_pdf_text.stylize(ACCENT_COLOR, 0, len(resume_pdf_title))
-        link_start = resume_pdf_text.plain.find(resume_link)
-        if link_start != -1:
-            resume_pdf_text.stylize(
-                f"link {resume_link}",
-                link_start,
-                link_start + len(resume_link),
-            )
         self.resume_view = Vertical(
-            Static(name_text, id="resume_name"),
-            Static(skills_text, id="resume_skills"),
-            Static(projects_text, id="resume_projects"),
-            Static(resume_pdf_text, id="resume_pdf"),
+            Static(CONTENT["resume_name"], id="resume_name"),
+            Static(CONTENT["resume_skills"], id="resume_skills"),
+            Static(CONTENT["resume_projects"], id="resume_projects"),
+            Static(CONTENT["resume_pdf"], id="resume_pdf"),
             id="resume_view",
         )
         self.nav_bar = Horizontal(
@@ -609,18 +715,108 @@ class SshSite(App):
             id="nav_bar",
         )
         self.body = Vertical(self.nav_bar, self.home_view, self.body_text, self.resume_view, id="body")
-        self.splash = RainSplash(id="splash")
-        yield self.splash
+        self.splash = None
+        if SPLASH_SECONDS > 0:
+            self.splash = RainSplash(id="splash")
+            yield self.splash
         yield self.body
 
     def on_mount(self) -> None:
         self.register_theme(THEME)
         self.theme = "aidanek"
         self.body.display = False
-        self._splash_duration = 5.0
-        self.set_timer(self._splash_duration, self._dismiss_splash)
+        self._splash_timer = None
+        if self.splash is None:
+            self._show_main()
+        else:
+            self._splash_timer = self.set_timer(SPLASH_SECONDS, self._dismiss_splash)
+        self._profiler = None
+        if os.environ.get("SSHSITE_SAMPLER") == "1":
+            SAMPLER.start()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, SAMPLER.toggle)
+        # not through the loop: a child stuck writing to a dead terminal never
+        # gets back to it, and SIGTERM has to kill it regardless
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        self._control = None
+        self._control_buffer = b""
+        if CONTROL_FD is not None:
+            self._control = socket.socket(fileno=int(CONTROL_FD))
+            self._control.setblocking(False)
+            asyncio.get_running_loop().add_reader(self._control.fileno(), self._on_control)
+            self._frames_reported = 0
+            self.set_interval(1.0, self._report_frames)
+
+    def _on_control(self) -> None:
+        try:
+            data = self._control.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            asyncio.get_running_loop().remove_reader(self._control.fileno())
+            return
+        self._control_buffer += data
+        while b"\n" in self._control_buffer:
+            line, self._control_buffer = self._control_buffer.split(b"\n", 1)
+            self._handle_control(line.decode(errors="replace").split())
+
+    def _handle_control(self, args: list[str]) -> None:
+        if args == ["profile", "on"] and self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif args == ["profile", "off"] and self._profiler is not None:
+            self._profiler.disable()
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(PROFILE_DIR / f"app-{os.getpid()}-{int(time.time())}.prof")
+            self._profiler = None
+        elif args == ["sampler", "on"]:
+            SAMPLER.start()
+        elif args == ["sampler", "off"]:
+            SAMPLER.stop()
+        elif args == ["throttle", "on"]:
+            FRAMES.set_active(True)
+        elif args == ["throttle", "off"]:
+            FRAMES.set_active(False)
+            self._report_frames()
+
+    def _report_frames(self) -> None:
+        if FRAMES.dropped != self._frames_reported:
+            self._frames_reported = FRAMES.dropped
+            self._send_control(f"frames_dropped {FRAMES.dropped}")
+
+    def _on_sigterm(self, signum, frame) -> None:
+        # server.py terminates the child when the visitor disconnects; write
+        # out the sampler's last window, then die the way SIGTERM always did
+        SAMPLER.stop()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def _send_control(self, line: str) -> None:
+        try:
+            self._control.send(line.encode() + b"\n")
+        except OSError:
+            pass
+
+    async def on_key(self, event: events.Key) -> None:
+        # the first key during the splash only skips it, it doesn't navigate
+        if self._splash_timer is None:
+            return
+        event.prevent_default()
+        event.stop()
+        self._splash_timer.stop()
+        self._splash_timer = None
+        # end the pulse chain before removing, or it keeps re-arming on a
+        # widget that is no longer mounted
+        self.splash.stop_pulse()
+        self.splash.stop_rain()
+        await self.animator.stop_animation(self.splash.styles, "opacity", complete=False)
+        self._hide_splash()
+        self._show_main()
 
     def _dismiss_splash(self) -> None:
+        self._splash_timer = None
         self.splash.stop_pulse()
         self.splash.stop_rain()
         self.splash.styles.animate(
@@ -632,7 +828,8 @@ class SshSite(App):
         self.set_timer(1.0, self._show_main)
 
     def _hide_splash(self) -> None:
-        self.splash.display = False
+        # removed rather than hidden so the rain stops ticking
+        self.splash.remove()
 
     def _show_main(self) -> None:
         self.body.display = True
@@ -643,8 +840,8 @@ class SshSite(App):
             button = self.query_one(f"#{button_id}", Button)
             button.set_class(button_id == active_id, "is-active")
 
-    def _show_body_text(self, content: str) -> None:
-        self.body_text.update(content)
+    def _show_body_text(self, body: Text) -> None:
+        self.body_text.update(body)
         self.body_text.display = True
         self.resume_view.display = False
         self.home_view.display = False
@@ -665,21 +862,7 @@ class SshSite(App):
 
     def action_help(self) -> None:
         self.sub_title = "help"
-        help_text = Text(HELP)
-        offset = 0
-        for line in HELP.splitlines():
-            if line.startswith("h ·"):
-                help_text.stylize(ACCENT_COLOR, offset, offset + 1)
-            elif line.startswith("? ·"):
-                help_text.stylize(ACCENT_COLOR, offset, offset + 1)
-            elif line.startswith("r ·"):
-                help_text.stylize(ACCENT_COLOR, offset, offset + 1)
-            elif line.startswith("^p ·"):
-                help_text.stylize(ACCENT_COLOR, offset, offset + 2)
-            elif line.startswith("q ·"):
-                help_text.stylize(ACCENT_COLOR, offset, offset + 1)
-            offset += len(line) + 1
-        self._show_body_text(help_text)
+        self._show_body_text(CONTENT["help"])
         self.body_text.styles.text_align = "center"
         self.body_text.styles.border = ("wide", ACCENT_COLOR)
         self.body_text.styles.padding = (1, 3)
@@ -691,6 +874,20 @@ class SshSite(App):
         self.resume_view.display = True
         self._set_active_nav("nav_resume")
 
+    def show_catalog_entry(self, entry: dict) -> None:
+        self.sub_title = entry["kind"]
+        body = Text()
+        body.append(entry["title"], style=ACCENT_COLOR)
+        body.append(f"\n{entry['kind']}")
+        if entry.get("summary"):
+            body.append(f"\n\n{entry['summary']}")
+        if entry.get("tags"):
+            body.append("\n\n" + ", ".join(entry["tags"]), style="dim")
+        if entry.get("url"):
+            body.append("\n\n")
+            body.append(entry["url"], style=f"link {entry['url']}")
+        self._show_body_text(body)
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "nav_home":
             self._set_active_nav("nav_home")
@@ -709,3 +906,4 @@ class SshSite(App):
 
 if __name__ == "__main__":
     SshSite().run()
+    SAMPLER.stop()
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import asyncssh
+
+import algorithms
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class _BenchServer(asyncssh.SSHServer):
+    def begin_auth(self, username):
+        return False
+
+
+async def _bulk(process):
+    # "bulk N" streams N bytes so cipher/MAC cost shows up, anything else exits
+    parts = (process.command or "").split()
+    if len(parts) == 2 and parts[0] == "bulk":
+        remaining = int(parts[1])
+        chunk = b"x" * 32768
+        while remaining > 0:
+            process.stdout.write(chunk[:remaining])
+            remaining -= len(chunk)
+            await process.stdout.drain()
+    process.exit(0)
+
+
+async def serve(set_name, host_key_type):
+    algs = algorithms.resolve(set_name)
+    key = asyncssh.generate_private_key(host_key_type)
+    server = await asyncssh.create_server(
+        _BenchServer,
+        "127.0.0.1",
+        0,
+        server_host_keys=[key],
+        process_factory=_bulk,
+        encoding=None,
+        **algorithms.connection_options(algs),
+    )
+    port = server.sockets[0].getsockname()[1]
+    print(port, flush=True)
+    await asyncio.Event().wait()
+
+
+def _cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 of proc(5)
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def _start_server(set_name, host_key_type, core):
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--serve", set_name]
+    cmd += ["--host-key-type", host_key_type]
+    # one core for the server so the numbers read as "per core"
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        preexec_fn=lambda: os.sched_setaffinity(0, {core}),
+    )
+    port = int(proc.stdout.readline())
+    return proc, port
+
+
+async def _handshakes(port, options, duration, concurrency):
+    latencies = []
+    failures = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal failures
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn = await asyncssh.connect(
+                    "127.0.0.1", port, username="bench", known_hosts=None, **options
+                )
+            except (OSError, asyncssh.Error):
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            conn.close()
+            await conn.wait_closed()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures
+
+
+async def _bulk_transfer(port, options, size):
+    async with asyncssh.connect(
+        "127.0.0.1", port, username="bench", known_hosts=None, **options
+    ) as conn:
+        start = time.perf_counter()
+        result = await conn.run(f"bulk {size}", encoding=None)
+        elapsed = time.perf_counter() - start
+    return len(result.stdout), elapsed
+
+
+async def bench_set(set_name, host_key_type, duration, concurrency, bulk_bytes, core):
+    algs = algorithms.resolve(set_name)
+    options = algorithms.connection_options(algs)
+    proc, port = _start_server(set_name, host_key_type, core)
+    try:
+        # warm up imports and key caches before measuring
+        await _handshakes(port, options, 0.5, 1)
+        cpu_start = _cpu_seconds(proc.pid)
+        wall_start = time.perf_counter()
+        latencies, failures = await _handshakes(port, options, duration, concurrency)
+        wall = time.perf_counter() - wall_start
+        cpu = _cpu_seconds(proc.pid) - cpu_start
+
+        row = {
+            "set": set_name,
+            "kex": (algs["kex"] or ["default"])[0],
+            "cipher": (algs["encryption"] or ["default"])[0],
+            "mac": (algs["mac"] or ["default"])[0],
+            "handshakes": len(latencies),
+            "failures": failures,
+            "per_sec": len(latencies) / wall,
+            "per_core_sec": len(latencies) / cpu if cpu else float("inf"),
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "bulk_mb_cpu_s": None,
+        }
+        if bulk_bytes:
+            cpu_start = _cpu_seconds(proc.pid)
+            received, _ = await _bulk_transfer(port, options, bulk_bytes)
+            cpu = _cpu_seconds(proc.pid) - cpu_start
+            # below one clock tick the transfer was too short to measure
+            row["bulk_mb_cpu_s"] = received / 1e6 / cpu if cpu else None
+        return row
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _print_rows(rows):
+    print(
+        f"{'set':<18}{'kex':<32}{'cipher':<32}{'mac':<32}"
+        f"{'ok':>7}{'fail':>6}{'hs/s':>9}{'hs/core-s':>11}{'p50 ms':>9}{'MB/core-s':>11}"
+    )
+    for row in rows:
+        bulk = row["bulk_mb_cpu_s"]
+        print(
+            f"{row['set']:<18}{row['kex']:<32}{row['cipher']:<32}{row['mac']:<32}"
+            f"{row['handshakes']:>7}{row['failures']:>6}{row['per_sec']:>9.1f}"
+            f"{row['per_core_sec']:>11.1f}{row['p50_ms']:>9.1f}"
+            f"{'-' if bulk is None else f'{bulk:.1f}':>11}"
+        )
+
+
+async def run(sets, host_key_type, duration, concurrency, bulk_bytes, core):
+    rows = []
+    for set_name in sets:
+        rows.append(
+            await bench_set(set_name, host_key_type, duration, concurrency, bulk_bytes, core)
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure SSH handshakes per second per core for each algorithm set."
+    )
+    parser.add_argument(
+        "--sets",
+        default=",".join(algorithms.ALGORITHM_SETS),
+        help="comma-separated names from algorithms.ALGORITHM_SETS",
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per set")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel client handshakes")
+    parser.add_argument("--bulk-mb", type=float, default=32.0, help="MB streamed per set, 0 to skip")
+    parser.add_argument("--host-key-type", default="ssh-ed25519")
+    parser.add_argument("--core", type=int, default=0, help="cpu the server is pinned to")
+    parser.add_argument("--serve", metavar="SET", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.serve, args.host_key_type))
+        return
+
+    # keep the client off the server's core when there is another one
+    other_cores = os.sched_getaffinity(0) - {args.core}
+    if other_cores:
+        os.sched_setaffinity(0, other_cores)
+    else:
+        print("note: single cpu, client and server share it; hs/core-s is still server cpu only")
+
+    sets = [name.strip() for name in args.sets.split(",") if name.strip()]
+    rows = asyncio.run(
+        run(
+            sets,
+            args.host_key_type,
+            args.duration,
+            args.concurrency,
+            int(args.bulk_mb * 1e6),
+            args.core,
+        )
+    )
+    _print_rows(rows)
+
+
+if __name__ == "__main__":
+    main()
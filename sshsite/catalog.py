@@ -0,0 +1,145 @@
+import bisect
+import re
+
+KINDS = ("project", "skill", "link", "post")
+# how much a hit in each field counts towards an entry's score
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "kind": 1.0, "summary": 1.0}
+MAX_WEIGHT = max(FIELD_WEIGHTS.values())
+# edits (insert, delete, substitute, swap two neighbours) a query word may be
+# from a vocabulary word and still count as a typo of it, by query length;
+# one and two letter words only match exactly or by prefix
+TYPO_LIMITS = ((2, 0), (5, 1))
+MAX_TYPOS = 2
+# a fuzzy hit never outranks an exact or prefix hit on the same word
+FUZZY_FACTOR = 0.7
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+def trigrams(word):
+    # padded so one and two letter words ("c", "go") still get grams
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(word):
+    for length, limit in TYPO_LIMITS:
+        if len(word) <= length:
+            return limit
+    return MAX_TYPOS
+
+
+def edit_distance(a, b):
+    # optimal string alignment: Levenshtein plus a swap of two neighbouring
+    # letters as a single edit, so "pyhton" is one edit from "python"
+    before, prev = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        row = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            row.append(cost)
+        before, prev = prev, row
+    return prev[-1]
+
+
+def _entry_fields(entry):
+    yield "title", entry["title"]
+    yield "kind", entry["kind"]
+    yield "summary", entry.get("summary", "")
+    for tag in entry.get("tags", ()):
+        yield "tags", tag
+
+
+def build_index(entries):
+    # vocabulary -> [(entry id, weight)], plus trigram -> vocabulary ids for
+    # typo matches; the vocabulary is sorted so prefixes are a bisect away
+    postings = {}
+    for entry_id, entry in enumerate(entries):
+        if entry["kind"] not in KINDS:
+            raise ValueError(f"catalog entry {entry['title']!r}: unknown kind {entry['kind']!r}")
+        for field, text in _entry_fields(entry):
+            for word in words(text):
+                best = postings.setdefault(word, {})
+                best[entry_id] = max(best.get(entry_id, 0.0), FIELD_WEIGHTS[field])
+    vocab = sorted(postings)
+    grams = {}
+    for word_id, word in enumerate(vocab):
+        for gram in trigrams(word):
+            grams.setdefault(gram, []).append(word_id)
+    return {
+        "entries": list(entries),
+        "vocab": vocab,
+        "postings": [sorted(postings[word].items()) for word in vocab],
+        "trigrams": grams,
+    }
+
+
+class CatalogIndex:
+    def __init__(self, index):
+        self.entries = index["entries"]
+        self._vocab = index["vocab"]
+        self._postings = index["postings"]
+        self._trigrams = index["trigrams"]
+
+    @classmethod
+    def from_entries(cls, entries):
+        return cls(build_index(entries))
+
+    def _word_matches(self, query_word):
+        # vocabulary id -> similarity in (0, 1]
+        matches = {}
+        start = bisect.bisect_left(self._vocab, query_word)
+        for word_id in range(start, len(self._vocab)):
+            word = self._vocab[word_id]
+            if not word.startswith(query_word):
+                break
+            matches[word_id] = 1.0 if word == query_word else 0.6 + 0.4 * len(query_word) / len(word)
+
+        # typos: words sharing a trigram are the candidates, edit distance
+        # decides; Jaccard on trigrams alone scores a swap in a short word
+        # ("pyhton") below unrelated words that happen to share grams
+        limit = max_typos(query_word)
+        if not limit:
+            return matches
+        candidates = set()
+        for gram in trigrams(query_word):
+            candidates.update(self._trigrams.get(gram, ()))
+        for word_id in candidates:
+            word = self._vocab[word_id]
+            if abs(len(word) - len(query_word)) > limit:
+                continue
+            distance = edit_distance(query_word, word)
+            if distance > limit:
+                continue
+            similarity = 1.0 - distance / max(len(word), len(query_word))
+            matches[word_id] = max(matches.get(word_id, 0.0), similarity * FUZZY_FACTOR)
+        return matches
+
+    def search(self, query, limit=20):
+        # -> [(entry, score in 0..1)], best first; every query word must hit
+        query_words = words(query)
+        if not query_words:
+            return []
+        scores = None
+        for query_word in query_words:
+            word_scores = {}
+            for word_id, similarity in self._word_matches(query_word).items():
+                for entry_id, weight in self._postings[word_id]:
+                    score = similarity * weight
+                    if score > word_scores.get(entry_id, 0.0):
+                        word_scores[entry_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {e: s + word_scores[e] for e, s in scores.items() if e in word_scores}
+            if not scores:
+                return []
+        top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        scale = len(query_words) * MAX_WEIGHT
+        return [(self.entries[entry_id], score / scale) for entry_id, score in top]
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tomllib
+from pathlib import Path
+
+from rich.color import Color, ColorSystem
+from rich.style import Style
+from rich.text import Span, Text
+
+import catalog
+
+BASE = Path(__file__).resolve().parent
+SOURCE_DIR = Path(os.environ.get("SSH_CONTENT_DIR", str(BASE.parent / "content")))
+BUILD_DIR = Path(os.environ.get("SSH_CONTENT_BUILD_DIR", str(SOURCE_DIR / "build")))
+
+# bump when the blob layout changes so old builds are not reused
+FORMAT_VERSION = 2
+# one blob per color profile, styles already downgraded for that terminal
+PROFILES = {
+    "truecolor": ColorSystem.TRUECOLOR,
+    "256": ColorSystem.EIGHT_BIT,
+    "standard": ColorSystem.STANDARD,
+}
+# old builds kept around for sessions that are still starting up
+KEEP_VERSIONS = 5
+
+
+def _sources(src_dir):
+    return sorted(Path(src_dir).glob("*.toml"))
+
+
+def source_version(src_dir=SOURCE_DIR):
+    digest = hashlib.sha256(f"format={FORMAT_VERSION}".encode())
+    for path in _sources(src_dir):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def load_source(src_dir=SOURCE_DIR):
+    source = {}
+    for path in _sources(src_dir):
+        with path.open("rb") as f:
+            source.update(tomllib.load(f))
+    return source
+
+
+def compile_blocks(source):
+    accent = source["style"]["accent"]
+    blocks = {"home": Text(source["home"]["text"])}
+
+    help_source = source["help"]
+    help_text = Text(help_source["title"] + "\n\n")
+    for entry in help_source["keys"]:
+        start = len(help_text)
+        help_text.append(f"{entry['key']} · {entry['label']}\n")
+        help_text.stylize(accent, start, start + len(entry["key"]))
+    blocks["help"] = help_text
+
+    resume = source["resume"]
+    name_text = Text(f"{resume['name']}\n{resume['tagline']}")
+    name_text.stylize(accent, 0, len(resume["name"]))
+    blocks["resume_name"] = name_text
+
+    skills_text = Text("Skills\n\n" + ", ".join(resume["skills"]))
+    skills_text.stylize(accent, 0, len("Skills"))
+    blocks["resume_skills"] = skills_text
+
+    projects_text = Text("Projects\n\n" + "\n\n".join(f"- {p}" for p in resume["projects"]))
+    projects_text.stylize(accent, 0, len("Projects"))
+    blocks["resume_projects"] = projects_text
+
+    pdf_text = Text(f"{resume['pdf_label']}: {resume['pdf_url']}")
+    pdf_text.stylize(accent, 0, len(resume["pdf_label"]))
+    link_start = len(resume["pdf_label"]) + 2
+    pdf_text.stylize(f"link {resume['pdf_url']}", link_start, link_start + len(resume["pdf_url"]))
+    blocks["resume_pdf"] = pdf_text
+    return blocks
+
+
+def _downgrade(color, system):
+    if color is None or system == ColorSystem.TRUECOLOR:
+        return color
+    downgraded = color.downgrade(system)
+    return Color.from_ansi(downgraded.number) if downgraded.number is not None else downgraded
+
+
+def _style_for(style, system):
+    style = Style.parse(style) if isinstance(style, str) else style
+    if system == ColorSystem.TRUECOLOR:
+        return str(style)
+    return str(
+        style
+        + Style.from_color(_downgrade(style.color, system), _downgrade(style.bgcolor, system))
+    )
+
+
+def serialize(blocks, system):
+    return {
+        "format": FORMAT_VERSION,
+        "blocks": {
+            name: {
+                "plain": text.plain,
+                "spans": [[s.start, s.end, _style_for(s.style, system)] for s in text.spans],
+            }
+            for name, text in blocks.items()
+        },
+    }
+
+
+def deserialize(data):
+    return {
+        name: Text(block["plain"], spans=[Span(*span) for span in block["spans"]])
+        for name, block in data["blocks"].items()
+    }
+
+
+def terminal_profile(env=os.environ):
+    if env.get("COLORTERM", "").lower() in ("truecolor", "24bit"):
+        return "truecolor"
+    if "256color" in env.get("TERM", ""):
+        return "256"
+    return "standard"
+
+
+def build(src_dir=SOURCE_DIR, build_dir=BUILD_DIR):
+    version = source_version(src_dir)
+    out = Path(build_dir) / version
+    if out.is_dir():
+        return out
+    source = load_source(src_dir)
+    blocks = compile_blocks(source)
+    # the search index is the same for every profile and built only here
+    index = catalog.build_index(source.get("catalog", []))
+    tmp = Path(build_dir) / f".{version}.{os.getpid()}.tmp"
+    tmp.mkdir(parents=True, exist_ok=True)
+    (tmp / "catalog.json").write_text(
+        json.dumps(index, separators=(",", ":"), ensure_ascii=False), encoding="utf-8"
+    )
+    for profile, system in PROFILES.items():
+        (tmp / f"{profile}.json").write_text(
+            json.dumps(serialize(blocks, system), separators=(",", ":"), ensure_ascii=False),
+            encoding="utf-8",
+        )
+    try:
+        # versions are published atomically so readers never see half a build
+        os.rename(tmp, out)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not out.is_dir():
+            raise
+    _prune(Path(build_dir), out)
+    return out
+
+
+def _prune(build_dir, current):
+    versions = sorted(
+        (p for p in build_dir.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in versions[KEEP_VERSIONS:]:
+        if old != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def load(version_dir, profile):
+    return deserialize(json.loads((Path(version_dir) / f"{profile}.json").read_bytes()))
+
+
+def compile_profile(profile, src_dir=SOURCE_DIR):
+    # no build available (e.g. running app.py directly): compile in-process
+    blocks = compile_blocks(load_source(src_dir))
+    return deserialize(serialize(blocks, PROFILES[profile]))
+
+
+def load_catalog(version_dir):
+    return catalog.CatalogIndex(json.loads((Path(version_dir) / "catalog.json").read_bytes()))
+
+
+def compile_catalog(src_dir=SOURCE_DIR):
+    return catalog.CatalogIndex.from_entries(load_source(src_dir).get("catalog", []))
+
+
+class ContentWatcher:
+    # rebuilds when content/ changes; new sessions get the newest version,
+    # live ones keep whatever they loaded at startup
+    def __init__(self, src_dir=SOURCE_DIR, build_dir=BUILD_DIR, interval=2.0):
+        self._src_dir = Path(src_dir)
+        self._build_dir = Path(build_dir)
+        self._interval = interval
+        self._signature = None
+        self.current = None
+
+    def _stat_signature(self):
+        return tuple(
+            (p.name, p.stat().st_mtime_ns, p.stat().st_size) for p in _sources(self._src_dir)
+        )
+
+    async def refresh(self):
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        try:
+            version = await asyncio.to_thread(build, self._src_dir, self._build_dir)
+        except Exception as exc:
+            logging.error("content build failed source=%s reason=%s", self._src_dir, exc)
+            return
+        if version != self.current:
+            logging.info("content version=%s path=%s", version.name, version)
+            self.current = version
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except OSError as exc:
+                logging.warning("content watch failed reason=%s", exc)
+            await asyncio.sleep(self._interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile content/ into render-ready blobs.")
+    parser.add_argument("--source", type=Path, default=SOURCE_DIR)
+    parser.add_argument("--out", type=Path, default=BUILD_DIR)
+    args = parser.parse_args()
+
+    version = build(args.source, args.out)
+    for name in [*PROFILES, "catalog"]:
+        path = version / f"{name}.json"
+        print(f"{path} {path.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
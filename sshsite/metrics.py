@@ -0,0 +1,85 @@
+import bisect
+import threading
+
+# bucket upper bounds in ms, roughly x1.4 apart from 0.25 ms to ~16 s
+_BOUNDS_MS = [0.25 * (2 ** (i / 2)) for i in range(33)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self._counts = [0] * (len(_BOUNDS_MS) + 1)
+        self._total = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        ms = seconds * 1000.0
+        with self._lock:
+            self._counts[bisect.bisect_left(_BOUNDS_MS, ms)] += 1
+            self._total += 1
+            self._sum += ms
+            if ms > self._max:
+                self._max = ms
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(_BOUNDS_MS) + 1)
+            self._total = 0
+            self._sum = 0.0
+            self._max = 0.0
+
+    @property
+    def count(self):
+        return self._total
+
+    def percentile(self, pct):
+        # upper bound of the bucket holding the pct-th sample, capped at max
+        with self._lock:
+            if not self._total:
+                return 0.0
+            rank = max(1, round(self._total * pct / 100.0))
+            seen = 0
+            for i, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank:
+                    bound = _BOUNDS_MS[i] if i < len(_BOUNDS_MS) else self._max
+                    return min(bound, self._max)
+            return self._max
+
+    def summary(self):
+        if not self._total:
+            return "n=0"
+        return "n=%d mean=%.1fms p50=%.1fms p90=%.1fms p99=%.1fms max=%.1fms" % (
+            self._total,
+            self._sum / self._total,
+            self.percentile(50),
+            self.percentile(90),
+            self.percentile(99),
+            self._max,
+        )
+
+
+class InputLatency:
+    # keystroke-to-screen as seen by the server, split into the time the
+    # child took to answer (pty + Textual handling and render) and the hop
+    # from the pty reader thread back onto the event loop
+    def __init__(self):
+        self.total = LatencyHistogram()
+        self.child = LatencyHistogram()
+        self.loop = LatencyHistogram()
+
+    def record(self, received, read, forwarded):
+        self.total.record(forwarded - received)
+        self.child.record(max(0.0, read - received))
+        self.loop.record(max(0.0, forwarded - read))
+
+    def reset(self):
+        self.total.reset()
+        self.child.reset()
+        self.loop.reset()
+
+
+GLOBAL_INPUT_LATENCY = InputLatency()
+# how late asyncio.sleep wakes up on the server loop
+LOOP_LAG = LatencyHistogram()
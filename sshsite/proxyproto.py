@@ -0,0 +1,142 @@
+import ipaddress
+import socket
+import struct
+
+# PROXY protocol v1/v2 as sent by HAProxy and nginx stream:
+# https://www.haproxy.org/download/2.9/doc/proxy-protocol.txt
+
+V1_PREFIX = b"PROXY "
+V1_MAX_LENGTH = 107
+V2_SIGNATURE = b"\r\n\r\n\x00\r\nQUIT\n"
+V2_HEADER_LENGTH = 16
+
+V2_CMD_LOCAL = 0x0
+V2_CMD_PROXY = 0x1
+V2_FAMILY_TCP4 = 0x11
+V2_FAMILY_TCP6 = 0x21
+
+
+class ProxyProtocolError(Exception):
+    pass
+
+
+def parse_trusted(spec):
+    networks = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+def is_trusted(host, networks):
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    # IPv4 clients on a dual-stack socket show up as ::ffff:a.b.c.d
+    if addr.version == 6 and addr.ipv4_mapped is not None:
+        addr = addr.ipv4_mapped
+    return any(addr in net for net in networks)
+
+
+async def _recv_exactly(loop, sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = await loop.sock_recv(sock, size - len(buf))
+        if not chunk:
+            raise ProxyProtocolError("connection closed inside header")
+        buf += chunk
+    return bytes(buf)
+
+
+async def read_header(loop, sock):
+    # reads exactly the header bytes so the SSH stream that follows is untouched;
+    # returns the (host, port) of the real client, or None for LOCAL/UNKNOWN
+    start = await _recv_exactly(loop, sock, len(V1_PREFIX))
+    if start == V1_PREFIX:
+        line = bytearray(start)
+        while not line.endswith(b"\r\n"):
+            if len(line) >= V1_MAX_LENGTH:
+                raise ProxyProtocolError("v1 header too long")
+            line += await _recv_exactly(loop, sock, 1)
+        return parse_v1(bytes(line))
+    if V2_SIGNATURE.startswith(start):
+        header = start + await _recv_exactly(loop, sock, V2_HEADER_LENGTH - len(start))
+        (length,) = struct.unpack("!H", header[14:16])
+        payload = await _recv_exactly(loop, sock, length) if length else b""
+        return parse_v2(header, payload)
+    raise ProxyProtocolError("missing PROXY header")
+
+
+def parse_v1(line):
+    try:
+        parts = line[:-2].decode("ascii").split(" ")
+    except UnicodeDecodeError:
+        raise ProxyProtocolError("v1 header is not ascii") from None
+    if len(parts) < 2 or parts[0] != "PROXY":
+        raise ProxyProtocolError("malformed v1 header")
+    if parts[1] == "UNKNOWN":
+        return None
+    if parts[1] not in ("TCP4", "TCP6") or len(parts) != 6:
+        raise ProxyProtocolError("malformed v1 header")
+    try:
+        src = ipaddress.ip_address(parts[2])
+        ipaddress.ip_address(parts[3])
+        src_port = int(parts[4])
+    except ValueError:
+        raise ProxyProtocolError("malformed v1 address") from None
+    if not 0 <= src_port <= 65535:
+        raise ProxyProtocolError("malformed v1 port")
+    return str(src), src_port
+
+
+def parse_v2(header, payload):
+    if header[:12] != V2_SIGNATURE:
+        raise ProxyProtocolError("bad v2 signature")
+    version, command = header[12] >> 4, header[12] & 0x0F
+    if version != 2:
+        raise ProxyProtocolError("unsupported v2 version")
+    if command == V2_CMD_LOCAL:
+        # health checks from the balancer itself
+        return None
+    if command != V2_CMD_PROXY:
+        raise ProxyProtocolError("unsupported v2 command")
+    family = header[13]
+    if family == V2_FAMILY_TCP4:
+        if len(payload) < 12:
+            raise ProxyProtocolError("short v2 TCP4 address block")
+        src = socket.inet_ntop(socket.AF_INET, payload[0:4])
+        (src_port,) = struct.unpack("!H", payload[8:10])
+        return src, src_port
+    if family == V2_FAMILY_TCP6:
+        if len(payload) < 36:
+            raise ProxyProtocolError("short v2 TCP6 address block")
+        src = socket.inet_ntop(socket.AF_INET6, payload[0:16])
+        (src_port,) = struct.unpack("!H", payload[32:34])
+        return src, src_port
+    # UNSPEC or non-TCP families carry no usable client address
+    return None
+
+
+def build_v1(src, dst):
+    family = "TCP6" if ipaddress.ip_address(src[0]).version == 6 else "TCP4"
+    return f"PROXY {family} {src[0]} {dst[0]} {src[1]} {dst[1]}\r\n".encode("ascii")
+
+
+def build_v2(src, dst):
+    if ipaddress.ip_address(src[0]).version == 6:
+        family, af = V2_FAMILY_TCP6, socket.AF_INET6
+    else:
+        family, af = V2_FAMILY_TCP4, socket.AF_INET
+    payload = (
+        socket.inet_pton(af, src[0])
+        + socket.inet_pton(af, dst[0])
+        + struct.pack("!HH", src[1], dst[1])
+    )
+    return (
+        V2_SIGNATURE
+        + bytes([(2 << 4) | V2_CMD_PROXY, family])
+        + struct.pack("!H", len(payload))
+        + payload
+    )
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import struct
+import time
+from pathlib import Path
+
+# Compact binary session log:
+#   magic, then records of (kind: u8, ms since session start: u32, payload)
+#   INPUT   u16 length + bytes from data_received
+#   RESIZE  u16 cols, rows, pixel width, pixel height
+#   OUTPUT  u32 byte count forwarded to the client
+#   END     u32 records dropped because the writer fell behind
+MAGIC = b"SSR1"
+INPUT, RESIZE, OUTPUT, END = 1, 2, 3, 4
+
+_HEADER = struct.Struct("<BI")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_SIZE = struct.Struct("<HHHH")
+
+# records buffered before new ones are dropped instead of growing memory
+QUEUE_SIZE = 4096
+
+
+class Recorder:
+    def __init__(self, path):
+        self._path = Path(path)
+        self._start = time.monotonic()
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._dropped = 0
+        self._closed = False
+        self._task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def _elapsed_ms(self):
+        return min(int((time.monotonic() - self._start) * 1000), 0xFFFFFFFF)
+
+    def _put(self, kind, payload):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(_HEADER.pack(kind, self._elapsed_ms()) + payload)
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+    def input(self, data):
+        data = data[:0xFFFF]
+        self._put(INPUT, _U16.pack(len(data)) + data)
+
+    def resize(self, cols, rows, pix_w=0, pix_h=0):
+        self._put(RESIZE, _SIZE.pack(cols or 0, rows or 0, pix_w or 0, pix_h or 0))
+
+    def output(self, count):
+        self._put(OUTPUT, _U32.pack(count))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        record = _HEADER.pack(END, self._elapsed_ms()) + _U32.pack(self._dropped)
+        try:
+            self._queue.put_nowait(record)
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # writer is hopelessly behind; stop it rather than wait on it
+            self._task.cancel()
+
+    async def _write_loop(self):
+        f = None
+        try:
+            f = await asyncio.to_thread(self._path.open, "wb")
+            await asyncio.to_thread(f.write, MAGIC)
+            while True:
+                batch = [await self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                done = batch[-1] is None
+                chunk = b"".join(item for item in batch if item is not None)
+                if chunk:
+                    await asyncio.to_thread(f.write, chunk)
+                if done:
+                    break
+        except OSError as exc:
+            # stop queueing; the session carries on unrecorded
+            self._closed = True
+            logging.warning("recording failed path=%s reason=%s", self._path, exc)
+        finally:
+            if f is not None:
+                try:
+                    await asyncio.to_thread(f.close)
+                except OSError:
+                    pass
+        if self._dropped:
+            logging.warning("recording dropped=%s path=%s", self._dropped, self._path)
+
+
+def read_records(path):
+    data = Path(path).read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session recording")
+    pos = len(MAGIC)
+    while pos + _HEADER.size <= len(data):
+        kind, t_ms = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        if kind == INPUT:
+            (length,) = _U16.unpack_from(data, pos)
+            pos += _U16.size
+            yield kind, t_ms, data[pos : pos + length]
+            pos += length
+        elif kind == RESIZE:
+            yield kind, t_ms, _SIZE.unpack_from(data, pos)
+            pos += _SIZE.size
+        elif kind in (OUTPUT, END):
+            yield kind, t_ms, _U32.unpack_from(data, pos)[0]
+            pos += _U32.size
+        else:
+            raise ValueError(f"{path}: unknown record kind {kind} at {pos}")
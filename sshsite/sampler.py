@@ -0,0 +1,122 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# Statistical profiler: a background thread snapshots every thread's stack
+# with sys._current_frames() and counts them as folded stacks
+# ("thread;file:func;file:func count"), the input format of flamegraph.pl,
+# inferno and speedscope. Each flush writes one file and starts a new window.
+# Nothing here logs: in the app child stderr is the visitor's terminal.
+
+# distinct stacks kept per window; samples of new stacks beyond this are
+# counted under a single [overflow] line instead of growing memory
+MAX_STACKS = 5000
+MAX_DEPTH = 64
+
+
+class Sampler:
+    def __init__(self, out_dir, name, hz=100.0, flush_interval=60.0):
+        self._out_dir = Path(out_dir)
+        self._name = name
+        self._interval = 1.0 / hz
+        self._flush_interval = flush_interval
+        self._counts = Counter()
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.last_error = None
+        self._flushes = 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _fold(self, thread_name, frame):
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name)
+        return ";".join(reversed(labels))
+
+    def _sample(self, own_ident):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                stack = self._fold(names.get(ident, "thread"), frame)
+                if stack in self._counts or len(self._counts) < MAX_STACKS:
+                    self._counts[stack] += 1
+                else:
+                    self._counts["[overflow]"] += 1
+            self.samples += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        next_flush = time.monotonic() + self._flush_interval
+        next_sample = time.monotonic()
+        while True:
+            next_sample += self._interval
+            # a late sample is skipped rather than taken twice in a row
+            next_sample = max(next_sample, time.monotonic())
+            if self._stop.wait(next_sample - time.monotonic()):
+                return
+            self._sample(own_ident)
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self._flush_interval
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return None
+        self._flushes += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        path = self._out_dir / f"{self._name}-{os.getpid()}-{stamp}-{self._flushes}.folded"
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            self._out_dir.mkdir(parents=True, exist_ok=True)
+            with tmp.open("w") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            os.replace(tmp, path)
+        except OSError as exc:
+            self.last_error = exc
+            return None
+        return path
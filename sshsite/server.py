@@ -1,19 +1,86 @@
 import asyncio, asyncssh
 import os, subprocess, sys, pty, fcntl, termios, struct
-import threading
+import signal, socket
+import io, itertools, time, traceback
 import logging
+from collections import deque
+from functools import partial
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+import algorithms
+import content
+import metrics
+import proxyproto
+import recording
+import sampler
+import session_store
+import shaping
+
 BASE = Path(__file__).resolve().parent
 APP = BASE / "app.py"
 
 LOG_PATH = BASE / "logs/server.log"
+PROFILE_DIR = BASE / "logs/profiles"
+SAMPLE_DIR = Path(os.environ.get("SSH_SAMPLER_DIR", str(BASE / "logs/samples")))
 
 HOST = os.environ.get("SSH_HOST", "127.0.0.1")
 PORT = int(os.environ.get("SSH_PORT", "3333"))
 HOST_KEY_PATH = Path(os.environ.get("SSH_HOST_KEY", str(BASE / "dev_host_key")))
 
+# SSH algorithm preferences: a named set from algorithms.py, optionally
+# with comma-separated per-category overrides (see bench_handshake.py)
+ALGORITHM_SET = os.environ.get("SSH_ALGORITHMS", algorithms.DEFAULT_SET)
+KEX_ALGS = os.environ.get("SSH_KEX_ALGS")
+ENCRYPTION_ALGS = os.environ.get("SSH_ENCRYPTION_ALGS")
+MAC_ALGS = os.environ.get("SSH_MAC_ALGS")
+
+# seconds to wait for live connections to finish after SIGTERM/SIGHUP
+DRAIN_TIMEOUT = float(os.environ.get("SSH_DRAIN_TIMEOUT", "300"))
+# seconds to wait for a successor to start listening during a reload
+HANDOVER_TIMEOUT = float(os.environ.get("SSH_HANDOVER_TIMEOUT", "30"))
+
+# local admin interface (see adminctl.py); disabled unless a path is set
+ADMIN_SOCKET = os.environ.get("SSH_ADMIN_SOCKET")
+
+# animation profile handed to new app children (full | lite, see app.py)
+ANIMATION_PROFILES = ("full", "lite")
+ANIMATION_PROFILE = os.environ.get("SSH_ANIMATION", "full")
+
+# opt-in traffic capture for replay load tests (test_sessions.py --replay)
+RECORD_DIR = os.environ.get("SSH_RECORD_DIR")
+
+# egress token buckets in bytes/s and burst bytes, per session and shared by
+# all sessions (0 disables); over budget, the app child drops animation frames
+EGRESS_RATE = int(os.environ.get("SSH_EGRESS_RATE", "262144"))
+EGRESS_BURST = int(os.environ.get("SSH_EGRESS_BURST", "131072"))
+EGRESS_GLOBAL_RATE = int(os.environ.get("SSH_EGRESS_GLOBAL_RATE", "2097152"))
+EGRESS_GLOBAL_BURST = int(os.environ.get("SSH_EGRESS_GLOBAL_BURST", "524288"))
+
+# folded-stack sampling profiler (sampler.py) for this process and every app
+# child; SIGUSR1 toggles it in whichever process receives it
+SAMPLER_ENABLED = os.environ.get("SSH_SAMPLER", "0") == "1"
+SAMPLER_HZ = float(os.environ.get("SSH_SAMPLER_HZ", "100"))
+SAMPLER_FLUSH = float(os.environ.get("SSH_SAMPLER_FLUSH", "60"))
+
+# a drag-resize arrives as a burst of window-change requests: the pty gets
+# the newest size once they pause for RESIZE_DEBOUNCE, and at least every
+# RESIZE_MAX_WAIT while they keep coming
+RESIZE_DEBOUNCE = 0.05
+RESIZE_MAX_WAIT = 0.25
+
+# seconds between global latency reports in the log
+METRICS_INTERVAL = float(os.environ.get("SSH_METRICS_INTERVAL", "60"))
+
+# first fd passed by systemd socket activation (sd_listen_fds)
+SD_LISTEN_FDS_START = 3
+
+# PROXY protocol v1/v2 from a TCP load balancer; only sources in
+# SSH_PROXY_TRUSTED may send a header, everyone else is treated as direct
+PROXY_PROTOCOL = os.environ.get("SSH_PROXY_PROTOCOL", "0") == "1"
+PROXY_TRUSTED = proxyproto.parse_trusted(os.environ.get("SSH_PROXY_TRUSTED", "127.0.0.1,::1"))
+PROXY_HEADER_TIMEOUT = 5.0
+
 # create logs directory if it doesn't exist
 LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
@@ -22,36 +89,167 @@ _formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
 _handler.setFormatter(_formatter)
 logging.basicConfig(level=logging.INFO, handlers=[_handler])
 
-# limit max concurrent sessions to 20
+# limit max concurrent sessions to 20, across every node sharing the store
 MAX_SESSIONS = 20
+# memory | sqlite:/path/to/sessions.db | redis://host:6379/0
+SESSION_STORE = os.environ.get("SSH_SESSION_STORE", "memory")
+SESSION_LEASE_TTL = float(os.environ.get("SSH_SESSION_LEASE_TTL", "30"))
+# reserve/release run inline on the event loop, so complain if they get slow
+SESSION_STORE_SLOW = 0.001
+_session_store = session_store.MemorySessionStore()
+
+def _timed_store_call(name, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        if elapsed > SESSION_STORE_SLOW:
+            logging.warning(
+                "session store slow op=%s store=%s ms=%.2f", name, SESSION_STORE, elapsed * 1000
+            )
+
+# store-wide session count as of the last reserve/release/renew; log lines
+# use this instead of asking the store (a blocking round trip with Redis)
 _active_sessions = 0
-_active_sessions_lock = threading.Lock()
+# returned by _try_reserve_session when the store itself failed
+STORE_ERROR = object()
 
 def _get_active_sessions():
-    with _active_sessions_lock:
-        return _active_sessions
+    return _active_sessions
+
+def _count_sessions():
+    # exact count straight from the store, for the admin socket
+    try:
+        return _timed_store_call("count", _session_store.count)
+    except Exception as exc:
+        logging.warning("session store count failed reason=%s", exc)
+        return None
 
 def _try_reserve_session():
     global _active_sessions
-    with _active_sessions_lock:
-        if _active_sessions >= MAX_SESSIONS:
-            return False
+    try:
+        lease = _timed_store_call("reserve", _session_store.reserve, MAX_SESSIONS)
+    except Exception as exc:
+        logging.error("session store reserve failed reason=%s", exc)
+        return STORE_ERROR
+    if lease is None:
+        _active_sessions = max(_active_sessions, MAX_SESSIONS)
+    else:
         _active_sessions += 1
-        return True
+    return lease
+
+def _release_session(lease):
+    global _active_sessions
+    _active_sessions = max(0, _active_sessions - 1)
+    try:
+        _timed_store_call("release", _session_store.release, lease)
+    except Exception as exc:
+        # the lease expires on its own once it stops being renewed
+        logging.error("session store release failed reason=%s", exc)
 
-def _release_session():
+async def _refresh_active_sessions():
+    # picks up sessions opened or expired on other nodes sharing the store
     global _active_sessions
-    with _active_sessions_lock:
-        if _active_sessions > 0:
-            _active_sessions -= 1
+    _active_sessions = await asyncio.to_thread(_session_store.count)
+
+async def _renew_leases():
+    while True:
+        await asyncio.sleep(SESSION_LEASE_TTL / 3)
+        try:
+            await asyncio.to_thread(_session_store.renew)
+            await _refresh_active_sessions()
+        except Exception as exc:
+            logging.error("session store renew failed reason=%s", exc)
+
+# optional limit on new sessions per client address per window; 0 disables
+RATE_LIMIT_SESSIONS = int(os.environ.get("SSH_RATE_LIMIT_SESSIONS", "0"))
+RATE_LIMIT_WINDOW = float(os.environ.get("SSH_RATE_LIMIT_WINDOW", "60"))
+_recent_sessions = {}
+
+def _rate_limited(host):
+    if RATE_LIMIT_SESSIONS <= 0:
+        return False
+    now = time.monotonic()
+    recent = _recent_sessions.get(host) or deque()
+    while recent and now - recent[0] > RATE_LIMIT_WINDOW:
+        recent.popleft()
+    if len(recent) >= RATE_LIMIT_SESSIONS:
+        return True
+    recent.append(now)
+    # reinserted so the dict stays ordered by each address's latest session;
+    # addresses whose latest session left the window fall off the front
+    _recent_sessions.pop(host, None)
+    _recent_sessions[host] = recent
+    # (host itself is last and current, so this stops before emptying it)
+    while True:
+        oldest = next(iter(_recent_sessions))
+        if now - _recent_sessions[oldest][-1] <= RATE_LIMIT_WINDOW:
+            break
+        del _recent_sessions[oldest]
+    return False
+
+# seconds of rain splash for new visitors, and for ones seen within
+# VISITOR_TTL (by address, or by offered client key with SSH_VISITOR_KEYS=1);
+# 0 skips the splash
+SPLASH_SECONDS = float(os.environ.get("SSH_SPLASH_SECONDS", "5.0"))
+RETURNING_SPLASH_SECONDS = float(os.environ.get("SSH_RETURNING_SPLASH_SECONDS", "0"))
+VISITOR_TTL = float(os.environ.get("SSH_VISITOR_TTL", "3600"))
+VISITOR_KEYS = os.environ.get("SSH_VISITOR_KEYS", "0") == "1"
+VISITOR_CACHE_SIZE = 10_000
+# visitor id -> expiry; insertion order is last-seen order
+_recent_visitors = {}
+
+def _returning_visitor(ids):
+    now = time.monotonic()
+    returning = any(_recent_visitors.get(i, 0.0) > now for i in ids)
+    for i in ids:
+        _recent_visitors.pop(i, None)
+        _recent_visitors[i] = now + VISITOR_TTL
+    # oldest first, so expired entries and overflow both come off the front
+    while _recent_visitors:
+        oldest = next(iter(_recent_visitors))
+        if _recent_visitors[oldest] > now and len(_recent_visitors) <= VISITOR_CACHE_SIZE:
+            break
+        del _recent_visitors[oldest]
+    return returning
+
+_sampler = sampler.Sampler(SAMPLE_DIR, "server", SAMPLER_HZ, SAMPLER_FLUSH)
+
+def _toggle_sampler():
+    _sampler.toggle()
+    logging.info(
+        "sampler running=%s hz=%s dir=%s samples=%s error=%s",
+        _sampler.running,
+        SAMPLER_HZ,
+        SAMPLE_DIR,
+        _sampler.samples,
+        _sampler.last_error,
+    )
+
+# open connections, so shutdown can drain them
+_live_connections = set()
+# rebuilds content/ on change; new app children load its current version
+_content_watcher = content.ContentWatcher()
+
+# running app sessions by id, for the admin socket
+_live_sessions = {}
+_session_ids = itertools.count(1)
 
 class Server(asyncssh.SSHServer):
-    def __init__(self):
+    def __init__(self, proxied_peer=None):
+        self._conn = None
         self._peer = None
+        self._proxied_peer = proxied_peer
         self._username = None
+        self._key_fingerprint = None
 
     def begin_auth(self, username):
         self._username = username
+        if VISITOR_KEYS:
+            # keys only recognise returning visitors; keyboard-interactive
+            # with no prompts still lets keyless clients straight in
+            return True
         logging.info(
             "auth accepted user=%s client=%s reason=%s",
             username,
@@ -59,13 +257,60 @@ class Server(asyncssh.SSHServer):
             "no_auth_required",
         )
         return False  # no auth for now (dev)
+
+    def public_key_auth_supported(self):
+        return VISITOR_KEYS
+
+    def validate_public_key(self, username, key):
+        # also called for unsigned key queries, so a client could claim a key
+        # it doesn't hold; all that buys is a shorter splash
+        fingerprint = key.get_fingerprint()
+        if fingerprint == self._key_fingerprint:
+            # second call for the same key, now with its signature
+            return True
+        self._key_fingerprint = fingerprint
+        logging.info(
+            "auth accepted user=%s client=%s reason=%s key=%s",
+            username,
+            self._peer,
+            "public_key",
+            self._key_fingerprint,
+        )
+        return True
+
+    def kbdint_auth_supported(self):
+        return VISITOR_KEYS
+
+    def get_kbdint_challenge(self, username, lang, submethods):
+        logging.info(
+            "auth accepted user=%s client=%s reason=%s",
+            username,
+            self._peer,
+            "keyboard_interactive",
+        )
+        return True
     
     def connection_made(self, conn):
-        self._peer = conn.get_extra_info("peername")
-        logging.info("connection accepted user=%s client=%s", self._username, self._peer)
+        self._conn = conn
+        self._peer = self._proxied_peer or conn.get_extra_info("peername")
+        _live_connections.add(self)
+        if self._proxied_peer:
+            logging.info(
+                "connection accepted user=%s client=%s via=%s",
+                self._username,
+                self._peer,
+                conn.get_extra_info("peername"),
+            )
+        else:
+            logging.info("connection accepted user=%s client=%s", self._username, self._peer)
         return super().connection_made(conn)
 
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
     def connection_lost(self, exc):
+        _live_connections.discard(self)
         if exc:
             logging.info(
                 "connection rejected/ended user=%s client=%s reason=%s",
@@ -82,7 +327,27 @@ class Server(asyncssh.SSHServer):
         return super().connection_lost(exc)
     
     def session_requested(self):
-        if not _try_reserve_session():
+        if self._peer and _rate_limited(self._peer[0]):
+            logging.info(
+                "session rejected user=%s client=%s reason=%s limit=%s window=%s",
+                self._username,
+                self._peer,
+                "rate_limited",
+                RATE_LIMIT_SESSIONS,
+                RATE_LIMIT_WINDOW,
+            )
+            return False
+        lease = _try_reserve_session()
+        if lease is STORE_ERROR:
+            logging.info(
+                "session rejected user=%s client=%s reason=%s store=%s",
+                self._username,
+                self._peer,
+                "store_error",
+                SESSION_STORE,
+            )
+            return False
+        if lease is None:
             logging.info(
                 "session rejected user=%s client=%s reason=%s active=%s max=%s",
                 self._username,
@@ -99,9 +364,21 @@ class Server(asyncssh.SSHServer):
             _get_active_sessions(),
             MAX_SESSIONS,
         )
-        return AppSession(_release_session)
+        visitor_ids = []
+        if self._peer:
+            visitor_ids.append(f"addr:{self._peer[0]}")
+        if self._key_fingerprint:
+            visitor_ids.append(f"key:{self._key_fingerprint}")
+        return AppSession(
+            partial(_release_session, lease), self._username, self._peer, visitor_ids
+        )
 
 
+def _read_pty(fd):
+    # runs in a worker thread; stamp the read before hopping back to the loop
+    data = os.read(fd, 1024)
+    return data, time.perf_counter()
+
 def _set_pty_size(fd, rows, cols, pix_w=0, pix_h=0):
     if rows is None or cols is None:
         return
@@ -110,8 +387,11 @@ def _set_pty_size(fd, rows, cols, pix_w=0, pix_h=0):
 
 
 class AppSession(asyncssh.SSHServerSession):
-    def __init__(self, on_close):
+    def __init__(self, on_close, username=None, peer=None, visitor_ids=()):
         self._chan = None
+        self._username = username
+        self._peer = peer
+        self._visitor_ids = visitor_ids
         self._pty_manager = None
         self._pty_subsidiary = None
         self._proc = None
@@ -121,13 +401,88 @@ class AppSession(asyncssh.SSHServerSession):
         self._term_size = None
         self._on_close = on_close
         self._released = False
+        self._id = next(_session_ids)
+        self._started = time.time()
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._control = None
+        self._recorder = None
+        # perf_counter of the first input batch not yet answered by output
+        self._input_pending = None
+        self._latency = metrics.InputLatency()
+        self._egress = shaping.TokenBucket()
+        self._egress_stats = shaping.EgressStats()
+        self._throttled = False
+        self._control_buffer = b""
+        self._resize_handle = None
+        self._resize_first = None
 
     def connection_made(self, chan):
         self._chan = chan
         self._chan.set_encoding(None)  # raw bytes for TUI
-        peer = self._chan.get_extra_info("peername")
-        user = self._chan.get_extra_info("username")
-        logging.info("session start user=%s client=%s", user, peer)
+        _live_sessions[self._id] = self
+        logging.info(
+            "session start id=%s user=%s client=%s", self._id, self._username, self._peer
+        )
+
+    def close(self):
+        if self._chan:
+            self._chan.close()
+
+    def send_control(self, command):
+        if self._control is None:
+            return False
+        try:
+            self._control.send(command.encode() + b"\n")
+        except OSError:
+            return False
+        return True
+
+    def _on_control_reply(self):
+        try:
+            data = self._control.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            asyncio.get_running_loop().remove_reader(self._control.fileno())
+            return
+        self._control_buffer += data
+        while b"\n" in self._control_buffer:
+            line, self._control_buffer = self._control_buffer.split(b"\n", 1)
+            args = line.decode(errors="replace").split()
+            if len(args) == 2 and args[0] == "frames_dropped" and args[1].isdigit():
+                # the child reports a running total
+                dropped = int(args[1]) - self._egress_stats.frames_dropped
+                self._egress_stats.frames_dropped += dropped
+                shaping.GLOBAL_STATS.frames_dropped += dropped
+
+    def _shape(self, count):
+        # -> seconds to hold off the next pty read
+        delay = max(
+            self._egress.take(count, EGRESS_RATE, EGRESS_BURST),
+            shaping.GLOBAL_BUCKET.take(count, EGRESS_GLOBAL_RATE, EGRESS_GLOBAL_BURST),
+        )
+        if delay <= 0:
+            if (
+                self._throttled
+                and self._egress.recovered(EGRESS_BURST)
+                and shaping.GLOBAL_BUCKET.recovered(EGRESS_GLOBAL_BURST)
+            ):
+                self._throttled = False
+                self.send_control("throttle off")
+            return 0.0
+        delay = min(delay, shaping.MAX_DELAY)
+        for stats in (self._egress_stats, shaping.GLOBAL_STATS):
+            stats.bytes_shaped += count
+            stats.delay += delay
+            if not self._throttled:
+                stats.throttles += 1
+        if not self._throttled:
+            self._throttled = True
+            self.send_control("throttle on")
+        return delay
 
     def pty_requested(self, term_type, term_size, term_modes):
         self._term_type = term_type
@@ -135,15 +490,64 @@ class AppSession(asyncssh.SSHServerSession):
         return True
 
     def terminal_size_changed(self, width, height, pixwidth, pixheight):
+        # every raw resize is recorded so replays reproduce the storm
+        if self._recorder is not None:
+            self._recorder.resize(width, height, pixwidth, pixheight)
+        self._term_size = (width, height, pixwidth, pixheight)
+        if self._pty_manager is None:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._resize_handle is None:
+            self._resize_first = now
+        else:
+            self._resize_handle.cancel()
+        when = min(now + RESIZE_DEBOUNCE, self._resize_first + RESIZE_MAX_WAIT)
+        self._resize_handle = loop.call_at(when, self._apply_resize)
+
+    def _apply_resize(self):
+        self._resize_handle = None
         if self._pty_manager is not None:
-            _set_pty_size(self._pty_manager, height, width, pixwidth, pixheight)
+            cols, rows, pix_w, pix_h = self._term_size
+            _set_pty_size(self._pty_manager, rows, cols, pix_w, pix_h)
+
+    def _start_recording(self):
+        path = Path(RECORD_DIR) / f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._id}.ssr"
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError as exc:
+            logging.warning("recording disabled path=%s reason=%s", path, exc)
+            return
+        self._recorder = recording.Recorder(path)
+        if self._term_size:
+            self._recorder.resize(*self._term_size)
 
     def shell_requested(self):
+        if RECORD_DIR:
+            self._start_recording()
         self._pty_manager, self._pty_subsidiary = pty.openpty()
         if self._term_size:
             cols, rows, pix_w, pix_h = self._term_size
             _set_pty_size(self._pty_subsidiary, rows, cols, pix_w, pix_h)
+        self._control, child_control = socket.socketpair()
+        self._control.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._control.fileno(), self._on_control_reply)
         env = os.environ.copy()
+        env.pop("NOTIFY_SOCKET", None)
+        env["SSHSITE_CONTROL_FD"] = str(child_control.fileno())
+        env["SSHSITE_PROFILE_DIR"] = str(PROFILE_DIR)
+        env["SSHSITE_SAMPLER"] = "1" if SAMPLER_ENABLED else "0"
+        env["SSHSITE_SAMPLER_DIR"] = str(SAMPLE_DIR)
+        env["SSHSITE_SAMPLER_HZ"] = str(SAMPLER_HZ)
+        env["SSHSITE_SAMPLER_FLUSH"] = str(SAMPLER_FLUSH)
+        env["SSHSITE_ANIMATION"] = ANIMATION_PROFILE
+        returning = _returning_visitor(self._visitor_ids)
+        splash = RETURNING_SPLASH_SECONDS if returning else SPLASH_SECONDS
+        env["SSHSITE_SPLASH_SECONDS"] = str(splash)
+        if returning:
+            logging.info("returning visitor id=%s client=%s splash=%s", self._id, self._peer, splash)
+        if _content_watcher.current is not None:
+            env["SSHSITE_CONTENT_DIR"] = str(_content_watcher.current)
         if self._term_type:
             env["TERM"] = self._term_type
 
@@ -154,9 +558,11 @@ class AppSession(asyncssh.SSHServerSession):
             stderr=self._pty_subsidiary,
             env=env,
             close_fds=True,
+            pass_fds=(child_control.fileno(),),
         )
         os.close(self._pty_subsidiary)
         self._pty_subsidiary = None
+        child_control.close()
 
         loop = asyncio.get_running_loop()
         self._reader_task = loop.create_task(self._forward_pty_to_ssh())
@@ -166,65 +572,444 @@ class AppSession(asyncssh.SSHServerSession):
     async def _forward_pty_to_ssh(self):
         try:
             while True:
-                data = await asyncio.to_thread(os.read, self._pty_manager, 1024)
+                data, read_at = await asyncio.to_thread(_read_pty, self._pty_manager)
                 if not data:
                     break
                 self._chan.write(data)
+                self._bytes_out += len(data)
+                if self._recorder is not None:
+                    self._recorder.output(len(data))
+                if self._input_pending is not None and read_at >= self._input_pending:
+                    # the next chunk read after input is taken as its echo/redraw
+                    forwarded_at = time.perf_counter()
+                    self._latency.record(self._input_pending, read_at, forwarded_at)
+                    metrics.GLOBAL_INPUT_LATENCY.record(self._input_pending, read_at, forwarded_at)
+                    self._input_pending = None
+                # bytes already read always go out whole (a cut escape sequence
+                # would garble the terminal); over budget we wait before reading
+                # more while the child skips frames
+                delay = self._shape(len(data))
+                if delay:
+                    await asyncio.sleep(delay)
         except Exception:
             pass
         finally:
             if self._chan:
                 self._chan.exit(0)
 
-    async def _wait_for_proc(self):
-        if not self._proc:
-            return
-        await asyncio.to_thread(self._proc.wait)
+    def _close_pty(self):
+        # shared by eof, child exit and connection loss, whichever comes first
+        if self._resize_handle is not None:
+            self._resize_handle.cancel()
+            self._resize_handle = None
         if self._pty_manager is not None:
             try:
                 os.close(self._pty_manager)
             except OSError:
                 pass
             self._pty_manager = None
+
+    async def _wait_for_proc(self):
+        if not self._proc:
+            return
+        await asyncio.to_thread(self._proc.wait)
+        self._close_pty()
         if self._chan:
             self._chan.exit(self._proc.returncode or 0)
 
     def data_received(self, data, datatype):
         if self._pty_manager is not None:
+            if self._input_pending is None:
+                self._input_pending = time.perf_counter()
+            self._bytes_in += len(data)
+            if self._recorder is not None:
+                self._recorder.input(data)
             os.write(self._pty_manager, data)
 
     def eof_received(self):
-        if self._pty_manager is not None:
-            try:
-                os.close(self._pty_manager)
-            except OSError:
-                pass
-            self._pty_manager = None
+        self._close_pty()
         return False
 
     def connection_lost(self, exc):
+        _live_sessions.pop(self._id, None)
         if self._proc and self._proc.poll() is None:
             self._proc.terminate()
-        if self._pty_manager is not None:
-            try:
-                os.close(self._pty_manager)
-            except OSError:
-                pass
-            self._pty_manager = None
+        if self._control is not None:
+            asyncio.get_running_loop().remove_reader(self._control.fileno())
+            self._control.close()
+            self._control = None
+        if self._recorder is not None:
+            self._recorder.close()
+        self._close_pty()
             
-        # extra info collection for logging
-        peer = self._chan.get_extra_info("peername") if self._chan else None
-        user = self._chan.get_extra_info("username") if self._chan else None
         if exc:
-            logging.info("session end user=%s client=%s reason=%s", user, peer, exc)
+            logging.info("session end user=%s client=%s reason=%s", self._username, self._peer, exc)
         else:
-            logging.info("session end user=%s client=%s", user, peer)
+            logging.info("session end user=%s client=%s", self._username, self._peer)
+        if self._latency.total.count:
+            logging.info(
+                "session latency user=%s client=%s total=[%s] child=[%s] loop=[%s]",
+                self._username,
+                self._peer,
+                self._latency.total.summary(),
+                self._latency.child.summary(),
+                self._latency.loop.summary(),
+            )
+        if self._egress_stats.bytes_shaped or self._egress_stats.frames_dropped:
+            logging.info(
+                "session egress user=%s client=%s bytes_out=%s %s",
+                self._username,
+                self._peer,
+                self._bytes_out,
+                self._egress_stats.summary(),
+            )
         if not self._released:
             self._released = True
             self._on_close()
             logging.info("session count active=%s max=%s", _get_active_sessions(), MAX_SESSIONS)
 
+def _listen_sockets():
+    # reload handover from a previous instance of this server
+    handover = os.environ.pop("SSH_HANDOVER_FDS", None)
+    if handover:
+        fds = [int(fd) for fd in handover.split(",")]
+    elif (
+        os.environ.get("LISTEN_PID") == str(os.getpid())
+        and int(os.environ.get("LISTEN_FDS", "0")) > 0
+    ):
+        count = int(os.environ["LISTEN_FDS"])
+        fds = list(range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count))
+    else:
+        fds = []
+    # don't leak activation state into app children or successors
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+
+    if not fds:
+        sock = socket.create_server((HOST, PORT), backlog=128)
+        sock.setblocking(False)
+        return [sock], False
+    sockets = []
+    for fd in fds:
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(False)
+        sockets.append(sock)
+    return sockets, True
+
+def _sd_notify(message):
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return
+    if addr.startswith("@"):
+        addr = "\0" + addr[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(addr)
+            sock.sendall(message.encode())
+    except OSError as exc:
+        logging.warning("sd_notify failed reason=%s", exc)
+
+def _signal_ready():
+    ready_fd = os.environ.pop("SSH_HANDOVER_READY_FD", None)
+    if ready_fd is not None:
+        try:
+            os.write(int(ready_fd), b"1")
+            os.close(int(ready_fd))
+        except OSError:
+            pass
+    # the successor takes over as the unit's main process
+    _sd_notify(f"MAINPID={os.getpid()}\nREADY=1")
+
+async def _handover(sockets, stop):
+    if stop.is_set():
+        return
+    fds = [sock.fileno() for sock in sockets]
+    read_fd, write_fd = os.pipe()
+    env = os.environ.copy()
+    env["SSH_HANDOVER_FDS"] = ",".join(str(fd) for fd in fds)
+    env["SSH_HANDOVER_READY_FD"] = str(write_fd)
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve())],
+            env=env,
+            pass_fds=(*fds, write_fd),
+            start_new_session=True,
+        )
+    except OSError as exc:
+        os.close(read_fd)
+        logging.error("handover failed reason=%s", exc)
+        return
+    finally:
+        os.close(write_fd)
+
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+
+    def _on_ready():
+        if not ready.done():
+            ready.set_result(os.read(read_fd, 1))
+
+    loop.add_reader(read_fd, _on_ready)
+    try:
+        result = await asyncio.wait_for(ready, HANDOVER_TIMEOUT)
+    except asyncio.TimeoutError:
+        result = b""
+    finally:
+        loop.remove_reader(read_fd)
+        os.close(read_fd)
+
+    if result != b"1":
+        # successor died or hung; keep serving from this instance
+        if proc.poll() is None:
+            proc.kill()
+        logging.error("handover failed successor=%s reason=%s", proc.pid, "not_ready")
+        return
+    logging.info("handover complete successor=%s", proc.pid)
+    stop.set()
+
+class ProxyAcceptor:
+    def __init__(self, sock, options):
+        self._sock = sock
+        self._options = options
+        self._task = asyncio.get_running_loop().create_task(self._accept_loop())
+
+    async def _accept_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn_sock, addr = await loop.sock_accept(self._sock)
+            except OSError as exc:
+                logging.warning("accept failed reason=%s", exc)
+                await asyncio.sleep(0.1)
+                continue
+            loop.create_task(self._handle(conn_sock, addr))
+
+    async def _handle(self, conn_sock, addr):
+        loop = asyncio.get_running_loop()
+        peer = None
+        if proxyproto.is_trusted(addr[0], PROXY_TRUSTED):
+            try:
+                peer = await asyncio.wait_for(
+                    proxyproto.read_header(loop, conn_sock), PROXY_HEADER_TIMEOUT
+                )
+            except (asyncio.TimeoutError, proxyproto.ProxyProtocolError, OSError) as exc:
+                logging.info(
+                    "connection rejected balancer=%s reason=%s",
+                    addr,
+                    str(exc) or "proxy_header_timeout",
+                )
+                conn_sock.close()
+                return
+        try:
+            await asyncssh.run_server(
+                conn_sock,
+                server_factory=partial(Server, peer),
+                **self._options,
+            )
+        except (OSError, asyncssh.Error) as exc:
+            logging.info("connection rejected/ended client=%s reason=%s", peer or addr, exc)
+
+    def close(self):
+        self._task.cancel()
+        self._sock.close()
+
+async def _report_metrics():
+    loop = asyncio.get_running_loop()
+    next_report = loop.time() + METRICS_INTERVAL
+    while True:
+        expected = loop.time() + 0.25
+        await asyncio.sleep(0.25)
+        metrics.LOOP_LAG.record(max(0.0, loop.time() - expected))
+        if loop.time() < next_report:
+            continue
+        next_report = loop.time() + METRICS_INTERVAL
+        latency = metrics.GLOBAL_INPUT_LATENCY
+        logging.info(
+            "latency global total=[%s] child=[%s] loop=[%s] loop_lag=[%s]",
+            latency.total.summary(),
+            latency.child.summary(),
+            latency.loop.summary(),
+            metrics.LOOP_LAG.summary(),
+        )
+        latency.reset()
+        metrics.LOOP_LAG.reset()
+        logging.info("egress global %s", shaping.GLOBAL_STATS.summary())
+
+def _admin_sessions(args):
+    now = time.time()
+    lines = ["id client user age_s bytes_in bytes_out shaped dropped pid"]
+    for sid, session in sorted(_live_sessions.items()):
+        lines.append(
+            "%s %s %s %d %d %d %d %d %s"
+            % (
+                sid,
+                session._peer,
+                session._username,
+                now - session._started,
+                session._bytes_in,
+                session._bytes_out,
+                session._egress_stats.bytes_shaped,
+                session._egress_stats.frames_dropped,
+                session._proc.pid if session._proc else "-",
+            )
+        )
+    return "\n".join(lines)
+
+def _admin_session(arg):
+    session = _live_sessions.get(int(arg))
+    if session is None:
+        raise ValueError(f"no session {arg}")
+    return session
+
+def _admin_kill(args):
+    session = _admin_session(args[0])
+    session.close()
+    return f"closed {session._id}"
+
+def _admin_profile(args):
+    session = _admin_session(args[0])
+    if args[1] not in ("on", "off"):
+        raise ValueError("usage: profile <id> on|off")
+    if not session.send_control(f"profile {args[1]}"):
+        raise ValueError(f"session {session._id} has no app child")
+    return f"profile {args[1]} for session {session._id}, output in {PROFILE_DIR}"
+
+def _admin_sampler(args):
+    if args[1] not in ("on", "off"):
+        raise ValueError("usage: sampler server|<id> on|off")
+    if args[0] == "server":
+        if _sampler.running != (args[1] == "on"):
+            _toggle_sampler()
+        return f"sampler {args[1]} for server, output in {SAMPLE_DIR}"
+    session = _admin_session(args[0])
+    if not session.send_control(f"sampler {args[1]}"):
+        raise ValueError(f"session {session._id} has no app child")
+    return f"sampler {args[1]} for session {session._id}, output in {SAMPLE_DIR}"
+
+def _animation_profile(value):
+    if value not in ANIMATION_PROFILES:
+        raise ValueError(f"animation must be one of {', '.join(ANIMATION_PROFILES)}")
+    return value
+
+# name -> (module global, parser); new values apply to the next admission/session
+_TUNABLES = {
+    "max_sessions": ("MAX_SESSIONS", int),
+    "rate_limit_sessions": ("RATE_LIMIT_SESSIONS", int),
+    "rate_limit_window": ("RATE_LIMIT_WINDOW", float),
+    "animation": ("ANIMATION_PROFILE", _animation_profile),
+    "splash_seconds": ("SPLASH_SECONDS", float),
+    "returning_splash_seconds": ("RETURNING_SPLASH_SECONDS", float),
+    "visitor_ttl": ("VISITOR_TTL", float),
+    "egress_rate": ("EGRESS_RATE", int),
+    "egress_burst": ("EGRESS_BURST", int),
+    "egress_global_rate": ("EGRESS_GLOBAL_RATE", int),
+    "egress_global_burst": ("EGRESS_GLOBAL_BURST", int),
+}
+
+def _admin_get(args):
+    return "\n".join(f"{name}={globals()[var]}" for name, (var, _) in _TUNABLES.items())
+
+def _admin_set(args):
+    if args[0] not in _TUNABLES:
+        raise ValueError(f"unknown setting {args[0]}")
+    var, parse = _TUNABLES[args[0]]
+    globals()[var] = parse(args[1])
+    return f"{args[0]}={globals()[var]}"
+
+def _admin_stats(args):
+    return (
+        f"pid={os.getpid()} active_sessions={_count_sessions()} "
+        f"live_sessions={len(_live_sessions)} connections={len(_live_connections)} "
+        f"max_sessions={MAX_SESSIONS} {shaping.GLOBAL_STATS.summary()}"
+    )
+
+def _admin_tasks(args):
+    out = io.StringIO()
+    for task in asyncio.all_tasks():
+        out.write(f"--- task {task.get_name()}\n")
+        task.print_stack(file=out)
+    for thread_id, frame in sys._current_frames().items():
+        out.write(f"--- thread {thread_id}\n")
+        out.write("".join(traceback.format_stack(frame)))
+    return out.getvalue()
+
+def _admin_help(args):
+    return "\n".join(
+        [
+            "sessions                 list live sessions",
+            "kill <id>                close a session",
+            "profile <id> on|off      cProfile inside a session's app child",
+            "sampler server|<id> on|off  folded-stack sampler in the server or an app child",
+            "get                      show tunables",
+            "set <name> <value>       change a tunable (" + ", ".join(_TUNABLES) + ")",
+            "stats                    counters for this process",
+            "tasks                    dump event loop task and thread stacks",
+        ]
+    )
+
+_ADMIN_COMMANDS = {
+    "sessions": (_admin_sessions, 0),
+    "kill": (_admin_kill, 1),
+    "profile": (_admin_profile, 2),
+    "sampler": (_admin_sampler, 2),
+    "get": (_admin_get, 0),
+    "set": (_admin_set, 2),
+    "stats": (_admin_stats, 0),
+    "tasks": (_admin_tasks, 0),
+    "help": (_admin_help, 0),
+}
+
+async def _handle_admin(reader, writer):
+    try:
+        line = await asyncio.wait_for(reader.readline(), 5.0)
+        args = line.decode(errors="replace").split()
+        if not args or args[0] not in _ADMIN_COMMANDS:
+            reply = "error: unknown command\n" + _admin_help([])
+        else:
+            handler, nargs = _ADMIN_COMMANDS[args[0]]
+            if len(args) - 1 != nargs:
+                raise ValueError(f"{args[0]} takes {nargs} argument(s)")
+            logging.info("admin command=%s", " ".join(args))
+            reply = handler(args[1:])
+    except Exception as exc:
+        reply = f"error: {exc}"
+    try:
+        writer.write(reply.rstrip("\n").encode() + b"\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def _start_admin():
+    if not ADMIN_SOCKET:
+        return None
+    # a reload successor takes the path over from the instance it replaces
+    try:
+        os.unlink(ADMIN_SOCKET)
+    except FileNotFoundError:
+        pass
+    old_umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(_handle_admin, path=ADMIN_SOCKET)
+    finally:
+        os.umask(old_umask)
+    logging.info("admin socket path=%s", ADMIN_SOCKET)
+    return server
+
+async def _drain(timeout):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while _live_connections and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.5)
+    if _live_connections:
+        logging.info("drain timeout closing=%s", len(_live_connections))
+        for server in list(_live_connections):
+            server.close()
+        await asyncio.sleep(1.0)
+
 async def main():
+    global _session_store
+    _session_store = session_store.open_store(SESSION_STORE, SESSION_LEASE_TTL)
+    await _refresh_active_sessions()
+
     # Generate a temp host key if not present
     if not HOST_KEY_PATH.exists():
         key = asyncssh.generate_private_key("ssh-ed25519")
@@ -234,20 +1019,72 @@ async def main():
     except OSError:
         logging.warning("unable to set permissions on host key path=%s", HOST_KEY_PATH)
 
-    await asyncssh.create_server(
-        Server,
-        host=HOST,
-        port=PORT,
-        server_host_keys=[str(HOST_KEY_PATH)],
-        allow_scp=False,
+    algs = algorithms.resolve(ALGORITHM_SET, KEX_ALGS, ENCRYPTION_ALGS, MAC_ALGS)
+    logging.info(
+        "algorithms set=%s kex=%s encryption=%s mac=%s",
+        ALGORITHM_SET,
+        ",".join(algs["kex"]) or "default",
+        ",".join(algs["encryption"]) or "default",
+        ",".join(algs["mac"]) or "default",
     )
-    
-    if HOST in {"127.0.0.1", "::1", "localhost"}:
+    options = {
+        "server_host_keys": [str(HOST_KEY_PATH)],
+        "allow_scp": False,
+        **algorithms.connection_options(algs),
+    }
+    await _content_watcher.refresh()
+    sockets, inherited = _listen_sockets()
+    acceptors = []
+    for sock in sockets:
+        if PROXY_PROTOCOL:
+            acceptors.append(ProxyAcceptor(sock, options))
+        else:
+            acceptors.append(await asyncssh.create_server(Server, sock=sock, **options))
+
+    if not inherited and HOST in {"127.0.0.1", "::1", "localhost"}:
         logging.warning(
             "host is loopback; set SSH_HOST=0.0.0.0 to accept public connections"
         )
-    print(f"Listening on ssh://{HOST}:{PORT}")
-    await asyncio.Future()
+    addresses = ", ".join(str(sock.getsockname()) for sock in sockets)
+    logging.info(
+        "listening addresses=%s inherited=%s proxy_protocol=%s pid=%s",
+        addresses,
+        inherited,
+        PROXY_PROTOCOL,
+        os.getpid(),
+    )
+    print(f"Listening on {addresses}")
+    admin = await _start_admin()
+    _signal_ready()
+
+    loop = asyncio.get_running_loop()
+    if SAMPLER_ENABLED:
+        _toggle_sampler()
+    loop.add_signal_handler(signal.SIGUSR1, _toggle_sampler)
+    renew_task = loop.create_task(_renew_leases())
+    metrics_task = loop.create_task(_report_metrics())
+    content_task = loop.create_task(_content_watcher.run())
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+    loop.add_signal_handler(
+        signal.SIGHUP, lambda: loop.create_task(_handover(sockets, stop))
+    )
+    await stop.wait()
+
+    logging.info("shutdown draining=%s timeout=%s", len(_live_connections), DRAIN_TIMEOUT)
+    for acceptor in acceptors:
+        acceptor.close()
+    if admin is not None:
+        admin.close()
+    await _drain(DRAIN_TIMEOUT)
+    renew_task.cancel()
+    metrics_task.cancel()
+    content_task.cancel()
+    _session_store.close()
+    if _sampler.running:
+        _toggle_sampler()
+    logging.info("shutdown complete")
 
 if __name__ == "__main__":
     asyncio.run(main())
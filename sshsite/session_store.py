@@ -0,0 +1,192 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# Session slots are leases: a node renews its own leases every ttl/3 and
+# anything not renewed within ttl belongs to a dead node and is reclaimed.
+
+
+def _node_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemorySessionStore:
+    # single process, nothing can crash without taking the counter with it
+    def __init__(self):
+        self._leases = set()
+        self._lock = threading.Lock()
+
+    def reserve(self, limit):
+        with self._lock:
+            if len(self._leases) >= limit:
+                return None
+            lease = uuid.uuid4().hex
+            self._leases.add(lease)
+            return lease
+
+    def release(self, lease):
+        with self._lock:
+            self._leases.discard(lease)
+
+    def renew(self):
+        pass
+
+    def count(self):
+        with self._lock:
+            return len(self._leases)
+
+    def close(self):
+        pass
+
+
+class SqliteSessionStore:
+    # shared between processes on one host, e.g. an instance draining
+    # during a reload and its successor
+    def __init__(self, path, ttl, node=None):
+        self._ttl = ttl
+        self._node = node or _node_id()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=1.0, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "id TEXT PRIMARY KEY, node TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS leases_expires ON leases (expires)")
+
+    def reserve(self, limit):
+        now = time.time()
+        lease = f"{self._node}:{uuid.uuid4().hex}"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+                (active,) = self._db.execute("SELECT COUNT(*) FROM leases").fetchone()
+                if active >= limit:
+                    lease = None
+                else:
+                    self._db.execute(
+                        "INSERT INTO leases (id, node, expires) VALUES (?, ?, ?)",
+                        (lease, self._node, now + self._ttl),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return lease
+
+    def release(self, lease):
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def renew(self):
+        with self._lock:
+            self._db.execute(
+                "UPDATE leases SET expires = ? WHERE node = ?",
+                (time.time() + self._ttl, self._node),
+            )
+
+    def count(self):
+        with self._lock:
+            (active,) = self._db.execute(
+                "SELECT COUNT(*) FROM leases WHERE expires >= ?", (time.time(),)
+            ).fetchone()
+        return active
+
+    def close(self):
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE node = ?", (self._node,))
+            self._db.close()
+
+
+class RedisSessionStore:
+    # shared between hosts; leases live in one sorted set scored by expiry,
+    # using the redis clock so node clocks don't need to agree
+    _RESERVE = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    return 1
+    """
+    _RENEW = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    for i = 2, #ARGV do
+        redis.call('ZADD', KEYS[1], 'XX', now + tonumber(ARGV[1]), ARGV[i])
+    end
+    return 0
+    """
+    _COUNT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    return redis.call('ZCOUNT', KEYS[1], now, '+inf')
+    """
+
+    def __init__(self, url, ttl, node=None, key="sshsite:sessions"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis session store requires the redis package") from None
+        self._ttl = ttl
+        self._node = node or _node_id()
+        self._key = key
+        self._held = set()
+        self._lock = threading.Lock()
+        self._client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self._reserve = self._client.register_script(self._RESERVE)
+        self._renew = self._client.register_script(self._RENEW)
+        self._count = self._client.register_script(self._COUNT)
+
+    def reserve(self, limit):
+        lease = f"{self._node}:{uuid.uuid4().hex}"
+        if not self._reserve(keys=[self._key], args=[limit, self._ttl, lease]):
+            return None
+        with self._lock:
+            self._held.add(lease)
+        return lease
+
+    def release(self, lease):
+        with self._lock:
+            self._held.discard(lease)
+        self._client.zrem(self._key, lease)
+
+    def renew(self):
+        with self._lock:
+            held = list(self._held)
+        if held:
+            self._renew(keys=[self._key], args=[self._ttl, *held])
+
+    def count(self):
+        return int(self._count(keys=[self._key]))
+
+    def close(self):
+        with self._lock:
+            held = list(self._held)
+            self._held.clear()
+        if held:
+            self._client.zrem(self._key, *held)
+        self._client.close()
+
+
+def open_store(spec, ttl):
+    # memory | sqlite:/path/to/sessions.db | redis://host:6379/0
+    if spec == "memory":
+        return MemorySessionStore()
+    if spec.startswith("sqlite:"):
+        path = spec[len("sqlite:"):]
+        if path.startswith("//"):
+            path = path[2:]
+        return SqliteSessionStore(path, ttl)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(spec, ttl)
+    raise ValueError(f"unknown session store: {spec}")
@@ -0,0 +1,52 @@
+import time
+
+# a session over budget waits at most this long before its next pty read;
+# the rest of the excess is handled by the app dropping animation frames
+MAX_DELAY = 0.25
+
+
+class TokenBucket:
+    # rate and burst are passed on every call so admin changes apply at once;
+    # a rate of 0 means unlimited
+    def __init__(self):
+        self.tokens = None
+        self._last = time.monotonic()
+
+    def take(self, count, rate, burst):
+        # -> seconds until the bucket is back out of debt (0 when within budget)
+        now = time.monotonic()
+        if rate <= 0:
+            self.tokens = None
+            self._last = now
+            return 0.0
+        if self.tokens is None:
+            self.tokens = burst
+        self.tokens = min(burst, self.tokens + (now - self._last) * rate)
+        self._last = now
+        self.tokens -= count
+        # debt is capped at one burst so a long stall isn't repaid forever
+        self.tokens = max(self.tokens, -burst)
+        return -self.tokens / rate if self.tokens < 0 else 0.0
+
+    def recovered(self, burst):
+        # True once at least half a burst is available again
+        return self.tokens is None or self.tokens >= burst / 2
+
+
+class EgressStats:
+    def __init__(self):
+        self.bytes_shaped = 0
+        self.delay = 0.0
+        self.throttles = 0
+        self.frames_dropped = 0
+
+    def summary(self):
+        return (
+            f"bytes_shaped={self.bytes_shaped} delay_s={self.delay:.2f} "
+            f"throttles={self.throttles} frames_dropped={self.frames_dropped}"
+        )
+
+
+# shared by every session in this process
+GLOBAL_BUCKET = TokenBucket()
+GLOBAL_STATS = EgressStats()
@@ -0,0 +1,45 @@
+import catalog
+
+ENTRIES = [
+    {"kind": "project", "title": "SSH config command line utility", "tags": ["ssh", "cli"]},
+    {"kind": "skill", "title": "Python"},
+    {"kind": "skill", "title": "Linux", "tags": ["systemd"]},
+    {"kind": "skill", "title": "C"},
+    {"kind": "link", "title": "GitHub", "tags": ["code"]},
+]
+INDEX = catalog.CatalogIndex.from_entries(ENTRIES)
+
+
+def titles(query):
+    return [entry["title"] for entry, _ in INDEX.search(query)]
+
+
+def test_edit_distance_counts_a_swap_as_one_edit():
+    assert catalog.edit_distance("pyhton", "python") == 1
+    assert catalog.edit_distance("linx", "linux") == 1
+    assert catalog.edit_distance("python", "python") == 0
+
+
+def test_swapped_letters():
+    assert titles("pyhton")[:1] == ["Python"]
+    assert titles("gihtub")[:1] == ["GitHub"]
+
+
+def test_missing_letter_ranks_the_closer_word_first():
+    assert titles("linx")[:1] == ["Linux"]
+    assert titles("pythn")[:1] == ["Python"]
+
+
+def test_prefix_beats_typo():
+    prefix = dict((entry["title"], score) for entry, score in INDEX.search("pyth"))
+    typo = dict((entry["title"], score) for entry, score in INDEX.search("pyhton"))
+    assert prefix["Python"] > typo["Python"]
+
+
+def test_short_words_only_match_exactly_or_by_prefix():
+    assert titles("c")[:1] == ["C"]
+    assert "Linux" not in titles("lx")
+
+
+def test_unrelated_words_miss():
+    assert titles("xyz") == []
@@ -0,0 +1,100 @@
+import asyncio
+import socket
+
+import pytest
+
+import proxyproto
+from proxyproto import ProxyProtocolError
+
+TCP4 = (("203.0.113.7", 40001), ("192.0.2.1", 22))
+TCP6 = (("2001:db8::7", 40001), ("2001:db8::1", 22))
+
+
+def read_header(data):
+    # feed data through a socketpair; -> (parsed header, bytes left unread)
+    async def read():
+        ours, theirs = socket.socketpair()
+        with ours, theirs:
+            ours.setblocking(False)
+            theirs.sendall(data)
+            theirs.shutdown(socket.SHUT_WR)
+            loop = asyncio.get_running_loop()
+            result = await proxyproto.read_header(loop, ours)
+            rest = b""
+            while chunk := await loop.sock_recv(ours, 4096):
+                rest += chunk
+            return result, rest
+
+    return asyncio.run(read())
+
+
+def v2_parts(data):
+    return data[: proxyproto.V2_HEADER_LENGTH], data[proxyproto.V2_HEADER_LENGTH :]
+
+
+@pytest.mark.parametrize("src, dst", [TCP4, TCP6])
+def test_v1_round_trip(src, dst):
+    line = proxyproto.build_v1(src, dst)
+    assert proxyproto.parse_v1(line) == src
+    assert read_header(line + b"SSH-2.0-client\r\n") == (src, b"SSH-2.0-client\r\n")
+
+
+@pytest.mark.parametrize("src, dst", [TCP4, TCP6])
+def test_v2_round_trip(src, dst):
+    data = proxyproto.build_v2(src, dst)
+    assert proxyproto.parse_v2(*v2_parts(data)) == src
+    assert read_header(data + b"SSH-2.0-client\r\n") == (src, b"SSH-2.0-client\r\n")
+
+
+def test_v1_unknown_has_no_address():
+    assert proxyproto.parse_v1(b"PROXY UNKNOWN\r\n") is None
+
+
+def test_v2_local_has_no_address():
+    header = proxyproto.V2_SIGNATURE + bytes([(2 << 4) | proxyproto.V2_CMD_LOCAL, 0, 0, 0])
+    assert proxyproto.parse_v2(header, b"") is None
+
+
+def test_v1_oversized_line():
+    line = b"PROXY TCP4 " + b"1" * proxyproto.V1_MAX_LENGTH + b"\r\n"
+    with pytest.raises(ProxyProtocolError, match="too long"):
+        read_header(line)
+
+
+def test_v1_port_out_of_range():
+    with pytest.raises(ProxyProtocolError):
+        proxyproto.parse_v1(b"PROXY TCP4 203.0.113.7 192.0.2.1 70000 22\r\n")
+
+
+def test_v2_bad_signature():
+    header, payload = v2_parts(proxyproto.build_v2(*TCP4))
+    with pytest.raises(ProxyProtocolError):
+        proxyproto.parse_v2(b"\x00" + header[1:], payload)
+
+
+def test_v2_bad_version():
+    header, payload = v2_parts(proxyproto.build_v2(*TCP4))
+    header = header[:12] + bytes([(1 << 4) | proxyproto.V2_CMD_PROXY]) + header[13:]
+    with pytest.raises(ProxyProtocolError):
+        proxyproto.parse_v2(header, payload)
+
+
+@pytest.mark.parametrize("src, dst", [TCP4, TCP6])
+def test_v2_short_address_block(src, dst):
+    header, payload = v2_parts(proxyproto.build_v2(src, dst))
+    with pytest.raises(ProxyProtocolError):
+        proxyproto.parse_v2(header, payload[:-5])
+
+
+def test_missing_header():
+    with pytest.raises(ProxyProtocolError):
+        read_header(b"SSH-2.0-client\r\n")
+
+
+def test_is_trusted_with_mapped_addresses():
+    networks = proxyproto.parse_trusted("10.0.0.0/8, 2001:db8::/32")
+    assert proxyproto.is_trusted("10.1.2.3", networks)
+    assert proxyproto.is_trusted("::ffff:10.1.2.3", networks)
+    assert proxyproto.is_trusted("2001:db8::5", networks)
+    assert not proxyproto.is_trusted("::ffff:192.0.2.1", networks)
+    assert not proxyproto.is_trusted("not an address", networks)
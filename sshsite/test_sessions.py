@@ -1,31 +1,128 @@
 import argparse
 import asyncio
+import contextlib
 import os
+import random
+import socket
+import statistics
+import sys
 import time
+from pathlib import Path
+
 import asyncssh
 
+import proxyproto
+import recording
+from adminctl import admin_command
+
 DEFAULT_HOST = os.environ.get("SSH_HOST", "127.0.0.1")
 DEFAULT_PORT = int(os.environ.get("SSH_PORT", "3333"))
+DEFAULT_ADMIN_SOCKET = os.environ.get("SSH_ADMIN_SOCKET")
+
+# soak session behaviours and how often each is picked
+SOAK_MODES = {
+    "clean": 4,         # quit with q and let the app exit
+    "abrupt": 3,        # drop the TCP connection mid-session
+    "splash_drop": 2,   # drop within the first half second
+    "no_pty": 1,        # shell without a pty request
+}
+# splash length forced for every soak session, returning addresses included,
+# so splash_drop lands mid-splash; longer than the slowest clean quit
+SOAK_SPLASH_SECONDS = 5
+# allowed growth in fds over the idle baseline once everything has closed
+SOAK_FD_SLACK = 2
+# share of a mode's sessions allowed to fail (connect errors, quit timeouts);
+# a failed session never reached the cleanup path the soak is checking
+SOAK_FAIL_SLACK = 0.05
+# allowed RSS growth between the first and second half of the churn
+SOAK_RSS_SLACK = 0.10
+
+def _proxied_socket(host, port, proxy_protocol, idx):
+    # act like HAProxy: connect from the balancer and announce a fake client
+    sock = socket.create_connection((host, port))
+    dst = sock.getpeername()[:2]
+    if sock.family == socket.AF_INET6:
+        src = (f"2001:db8::{idx % 65535 + 1:x}", 40000 + idx % 20000)
+    else:
+        src = (f"203.0.113.{idx % 254 + 1}", 40000 + idx % 20000)
+    build = proxyproto.build_v2 if proxy_protocol == "v2" else proxyproto.build_v1
+    sock.sendall(build(src, dst))
+    return sock
+
+async def _connect(host, port, username, idx, proxy_protocol=None):
+    # the empty password answers the prompt-less keyboard-interactive round
+    # a server with SSH_VISITOR_KEYS=1 asks keyless clients for
+    options = {"username": username, "known_hosts": None, "password": ""}
+    if proxy_protocol:
+        sock = await asyncio.to_thread(_proxied_socket, host, port, proxy_protocol, idx)
+        return await asyncssh.connect(sock=sock, **options)
+    return await asyncssh.connect(host, port=port, **options)
+
+@contextlib.contextmanager
+def _server_settings(admin_socket, **overrides):
+    # change server tunables for the length of a run, restoring them after;
+    # yields the previous values (None without an admin socket)
+    if not admin_socket:
+        yield None
+        return
+    current = dict(line.split("=", 1) for line in admin_command(admin_socket, "get").split())
+    changed = []
+    try:
+        for name, value in overrides.items():
+            reply = admin_command(admin_socket, f"set {name} {value}")
+            if reply.startswith("error:"):
+                raise RuntimeError(f"admin set {name}: {reply.strip()}")
+            changed.append(name)
+        yield current
+    finally:
+        for name in changed:
+            admin_command(admin_socket, f"set {name} {current[name]}")
 
-async def _open_session(host, port, username, hold_seconds, idx):
+class _CountingSession(asyncssh.SSHClientSession):
+    def __init__(self):
+        self.received = 0
+
+    def data_received(self, data, datatype):
+        self.received += len(data)
+
+def load_recording(path):
+    # -> (initial (cols, rows, pix_w, pix_h), [(seconds, kind, payload)], output bytes)
+    size = (80, 24, 0, 0)
+    events = []
+    expected = 0
+    for kind, t_ms, payload in recording.read_records(path):
+        if kind == recording.RESIZE and not events and t_ms < 50:
+            size = payload
+        elif kind in (recording.INPUT, recording.RESIZE, recording.END):
+            events.append((t_ms / 1000.0, kind, payload))
+        elif kind == recording.OUTPUT:
+            expected += payload
+    return size, events, expected
+
+def load_recordings(path):
+    path = Path(path)
+    paths = sorted(path.glob("*.ssr")) if path.is_dir() else [path]
+    if not paths:
+        raise SystemExit(f"no recordings found in {path}")
+    return [load_recording(p) for p in paths]
+
+async def _open_session(host, port, username, hold_seconds, idx, proxy_protocol=None):
     conn = None
     chan = None
     try:
-        conn = await asyncssh.connect(
-            host,
-            port=port,
-            username=username,
-            known_hosts=None,
-        )
+        conn = await _connect(host, port, username, idx, proxy_protocol)
         result = await conn.create_session(asyncssh.SSHClientSession, term_type="xterm")
         if isinstance(result, tuple) and len(result) == 2:
             session, chan = result
         else:
             chan = result
         await asyncio.sleep(hold_seconds)
-        return True
+        return True, 0, 0
+    except asyncssh.ChannelOpenError:
+        # the server turned the session down (session cap or rate limit)
+        return None, 0, 0
     except Exception:
-        return False
+        return False, 0, 0
     finally:
         if chan is not None:
             try:
@@ -39,15 +136,259 @@ async def _open_session(host, port, username, hold_seconds, idx):
             except Exception:
                 pass
 
-async def run(count, hold_seconds, host, port, username):
-    tasks = [
-        asyncio.create_task(_open_session(host, port, username, hold_seconds, idx))
-        for idx in range(count)
-    ]
+async def _replay_session(host, port, username, script, idx, speed, proxy_protocol=None):
+    # drive one session with a recorded input stream, keeping its timing
+    size, events, expected = script
+    conn = None
+    try:
+        conn = await _connect(host, port, username, idx, proxy_protocol)
+        chan, session = await conn.create_session(
+            _CountingSession,
+            term_type="xterm-256color",
+            term_size=size,
+            encoding=None,
+        )
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for at, kind, payload in events:
+            delay = start + at / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if chan.is_closing():
+                break
+            if kind == recording.INPUT:
+                chan.write(payload)
+            elif kind == recording.RESIZE:
+                chan.change_terminal_size(*payload)
+        chan.close()
+        return True, session.received, expected
+    except asyncssh.ChannelOpenError:
+        return None, 0, expected
+    except Exception:
+        return False, 0, expected
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+                await conn.wait_closed()
+            except Exception:
+                pass
+
+async def _soak_session(host, port, username, idx, mode, proxy_protocol=None):
+    conn = None
+    try:
+        conn = await _connect(host, port, username, idx, proxy_protocol)
+        if mode == "no_pty":
+            chan, session = await conn.create_session(_CountingSession, encoding=None)
+        else:
+            chan, session = await conn.create_session(
+                _CountingSession,
+                term_type="xterm-256color",
+                term_size=(80, 24),
+                encoding=None,
+            )
+        if mode == "splash_drop":
+            await asyncio.sleep(random.uniform(0.05, 0.5))
+            conn.abort()
+            return True
+        await asyncio.sleep(random.uniform(0.5, 3.0))
+        if mode == "abrupt":
+            conn.abort()
+            return True
+        # the first key only skips the splash
+        chan.write(b" ")
+        await asyncio.sleep(0.2)
+        chan.write(b"q")
+        await asyncio.wait_for(chan.wait_closed(), 10.0)
+        return True
+    except Exception:
+        return False
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+                await conn.wait_closed()
+            except Exception:
+                pass
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # fields after the parenthesised command name: state ppid ...
+        state, ppid = stat.rsplit(")", 1)[1].split()[:2]
+        if int(ppid) == pid:
+            children.append(state)
+    return children
+
+def sample_server(pid, admin_socket=None):
+    sample = {"fds": len(os.listdir(f"/proc/{pid}/fd"))}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key == "Threads":
+                sample["threads"] = int(value)
+            elif key == "VmRSS":
+                sample["rss_kb"] = int(value.split()[0])
+    children = _children(pid)
+    sample["children"] = len(children)
+    sample["zombies"] = children.count("Z")
+    if admin_socket:
+        stats = dict(
+            item.split("=", 1) for item in admin_command(admin_socket, "stats").split()
+        )
+        for key in ("active_sessions", "live_sessions", "connections"):
+            value = stats.get(key, "None")
+            sample[key] = int(value) if value.isdigit() else None
+    return sample
+
+async def _sample_loop(pid, admin_socket, interval, samples):
+    while True:
+        samples.append(await asyncio.to_thread(sample_server, pid, admin_socket))
+        await asyncio.sleep(interval)
+
+def _soak_failures(results, baseline, churn, final):
+    failures = []
+    for mode, (ok, failed) in results.items():
+        if failed and (not ok or failed > (ok + failed) * SOAK_FAIL_SLACK):
+            failures.append(f"{mode}: {failed} of {ok + failed} sessions failed")
+    idle_keys = ("children", "zombies", "active_sessions", "live_sessions", "connections")
+    for key in idle_keys:
+        if final.get(key):
+            failures.append(f"{key}={final[key]} after all sessions closed")
+    if final["fds"] > baseline["fds"] + SOAK_FD_SLACK:
+        failures.append(f"fds {baseline['fds']} -> {final['fds']} after all sessions closed")
+    if final["threads"] > max(s["threads"] for s in churn):
+        failures.append(f"threads {final['threads']} idle, above the churn peak")
+    if len(churn) >= 4:
+        first, second = churn[: len(churn) // 2], churn[len(churn) // 2 :]
+        # under steady churn the second half must not sit entirely above the first
+        for key in ("fds", "threads", "children"):
+            if min(s[key] for s in second) > max(s[key] for s in first):
+                failures.append(f"{key} drifting upward during churn")
+        rss_first = statistics.median(s["rss_kb"] for s in first)
+        rss_second = statistics.median(s["rss_kb"] for s in second)
+        if rss_second > rss_first * (1 + SOAK_RSS_SLACK):
+            failures.append(f"rss median {rss_first}kB -> {rss_second}kB during churn")
+    return failures
+
+async def soak(
+    count,
+    concurrency,
+    host,
+    port,
+    username,
+    server_pid,
+    admin_socket=None,
+    proxy_protocol=None,
+    interval=1.0,
+    settle=30.0,
+):
+    # churn from one address would trip a per-client rate limit and, after
+    # the first session, only see the returning-visitor splash
+    with _server_settings(
+        admin_socket,
+        rate_limit_sessions=0,
+        splash_seconds=SOAK_SPLASH_SECONDS,
+        returning_splash_seconds=SOAK_SPLASH_SECONDS,
+    ):
+        baseline = await asyncio.to_thread(sample_server, server_pid, admin_socket)
+        samples = []
+        sampler = asyncio.create_task(_sample_loop(server_pid, admin_socket, interval, samples))
+        modes = random.choices(list(SOAK_MODES), weights=SOAK_MODES.values(), k=count)
+        results = {mode: [0, 0] for mode in SOAK_MODES}
+        next_idx = iter(range(count))
+
+        async def worker():
+            for idx in next_idx:
+                ok = await _soak_session(host, port, username, idx, modes[idx], proxy_protocol)
+                results[modes[idx]][0 if ok else 1] += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        sampler.cancel()
+        churn = list(samples)
+
+        # let the server finish reaping before judging the idle state; fds
+        # close a little after the children exit, so wait for those as well
+        def settled(sample):
+            return (
+                not sample["children"]
+                and not sample.get("live_sessions")
+                and sample["fds"] <= baseline["fds"] + SOAK_FD_SLACK
+            )
+
+        deadline = time.monotonic() + settle
+        final = await asyncio.to_thread(sample_server, server_pid, admin_socket)
+        while time.monotonic() < deadline and not settled(final):
+            await asyncio.sleep(1.0)
+            final = await asyncio.to_thread(sample_server, server_pid, admin_socket)
+    return results, baseline, churn, final
+
+def _print_soak(results, baseline, churn, final, failures):
+    for mode, (ok, failed) in results.items():
+        print(f"{mode:<12} ok={ok} failed={failed}")
+    keys = [k for k in baseline if baseline[k] is not None]
+    print(f"{'':<12}" + "".join(f"{k:>16}" for k in keys))
+    rows = [("baseline", baseline)]
+    if churn:
+        rows += [("churn peak", {k: max(s[k] or 0 for s in churn) for k in keys})]
+    rows += [("final", final)]
+    for label, sample in rows:
+        print(f"{label:<12}" + "".join(f"{sample.get(k, '-')!s:>16}" for k in keys))
+    for failure in failures:
+        print("FAIL:", failure)
+    print("Soak result:", "FAIL" if failures else "PASS")
+
+async def _staggered(delay, coro):
+    await asyncio.sleep(delay)
+    return await coro
+
+async def run(
+    count,
+    hold_seconds,
+    host,
+    port,
+    username,
+    proxy_protocol=None,
+    scripts=None,
+    speed=1.0,
+    ramp=0.0,
+    admin_socket=None,
+):
+    overrides = {}
+    if scripts:
+        # a replay is a load test from one address: lift the session cap and
+        # rate limit so they don't decide how many sessions actually run
+        overrides = {"max_sessions": count, "rate_limit_sessions": 0}
+    with _server_settings(admin_socket, **overrides):
+        return await _run_sessions(
+            count, hold_seconds, host, port, username, proxy_protocol, scripts, speed, ramp
+        )
+
+async def _run_sessions(
+    count, hold_seconds, host, port, username, proxy_protocol, scripts, speed, ramp
+):
+    tasks = []
+    for idx in range(count):
+        if scripts:
+            script = scripts[idx % len(scripts)]
+            coro = _replay_session(host, port, username, script, idx, speed, proxy_protocol)
+        else:
+            coro = _open_session(host, port, username, hold_seconds, idx, proxy_protocol)
+        tasks.append(asyncio.create_task(_staggered(ramp * idx / max(1, count), coro)))
     results = await asyncio.gather(*tasks)
-    accepted = sum(1 for r in results if r)
+    accepted = sum(1 for ok, _, _ in results if ok)
+    refused = sum(1 for ok, _, _ in results if ok is None)
     rejected = count - accepted
-    return accepted, rejected
+    received = sum(r for _, r, _ in results)
+    expected = sum(e for ok, _, e in results if ok)
+    return accepted, rejected, refused, received, expected
 
 
 def main():
@@ -57,18 +398,93 @@ def main():
     parser.add_argument("--host", default=DEFAULT_HOST)
     parser.add_argument("--port", type=int, default=DEFAULT_PORT)
     parser.add_argument("--username", default=os.environ.get("USER") or "unknown")
+    parser.add_argument(
+        "--proxy-protocol",
+        choices=["v1", "v2"],
+        help="send a PROXY header per session, as a load balancer would "
+        "(server needs SSH_PROXY_PROTOCOL=1)",
+    )
+    parser.add_argument(
+        "--replay",
+        help="a .ssr recording or a directory of them (server SSH_RECORD_DIR); "
+        "sessions replay recorded input and resizes instead of idling for --hold",
+    )
+    parser.add_argument("--speed", type=float, default=1.0, help="replay time multiplier")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds to spread session starts over")
+    parser.add_argument(
+        "--soak",
+        type=int,
+        metavar="SESSIONS",
+        help="churn this many short sessions (clean quits, abrupt drops, mid-splash "
+        "drops, no-pty shells) and fail if server resources drift upward",
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel soak sessions")
+    parser.add_argument("--server-pid", type=int, help="server.py pid to sample (default: from admin stats)")
+    parser.add_argument("--admin-socket", default=DEFAULT_ADMIN_SOCKET)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--settle", type=float, default=30.0, help="seconds to wait for cleanup")
     args = parser.parse_args()
 
+    if args.soak:
+        server_pid = args.server_pid
+        if server_pid is None and args.admin_socket:
+            stats = admin_command(args.admin_socket, "stats")
+            server_pid = int(stats.split()[0].split("=", 1)[1])
+        if server_pid is None:
+            parser.error("--soak needs --server-pid or --admin-socket")
+        results, baseline, churn, final = asyncio.run(
+            soak(
+                args.soak,
+                args.concurrency,
+                args.host,
+                args.port,
+                args.username,
+                server_pid,
+                args.admin_socket,
+                args.proxy_protocol,
+                args.sample_interval,
+                args.settle,
+            )
+        )
+        failures = _soak_failures(results, baseline, churn, final)
+        _print_soak(results, baseline, churn, final, failures)
+        sys.exit(1 if failures else 0)
+
+    scripts = load_recordings(args.replay) if args.replay else None
     start = time.time()
-    accepted, rejected = asyncio.run(
-        run(args.count, args.hold, args.host, args.port, args.username)
+    accepted, rejected, refused, received, expected = asyncio.run(
+        run(
+            args.count,
+            args.hold,
+            args.host,
+            args.port,
+            args.username,
+            args.proxy_protocol,
+            scripts,
+            args.speed,
+            args.ramp,
+            args.admin_socket,
+        )
     )
     elapsed = time.time() - start
 
     print("Requested sessions:", args.count)
     print("Accepted sessions:", accepted)
     print("Rejected sessions:", rejected)
+    print("Refused by server:", refused)
+    if scripts:
+        print("Recordings:", len(scripts))
+        print("Bytes received:", received)
+        print("Bytes recorded:", expected)
     print("Elapsed seconds:", round(elapsed, 2))
+    if scripts and refused:
+        hint = "" if args.admin_socket else "; pass --admin-socket to lift them for the run"
+        print(
+            f"error: replay cut short, {refused} session(s) refused by the server's "
+            f"session cap or rate limit{hint}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
 
 
 if __name__ == "__main__":
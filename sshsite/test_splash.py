@@ -0,0 +1,20 @@
+import asyncio
+from collections import Counter
+
+import app
+
+
+def test_initial_drops_spread_across_the_width():
+    async def drops_at_mount():
+        site = app.SshSite()
+        async with site.run_test(size=(100, 30)) as pilot:
+            await pilot.pause(0.2)
+            return site.splash.size.width, list(site.splash._drops)
+
+    width, drops = asyncio.run(drops_at_mount())
+    assert len(drops) == max(12, width // 2)
+    columns = Counter(drop["x"] for drop in drops)
+    # columns are random, but 50 drops over 100 columns almost never stack
+    # six deep; drops built before layout all sat in column 0
+    assert max(columns.values()) <= 5
+    assert max(columns) > width // 2